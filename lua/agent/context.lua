@@ -0,0 +1,54 @@
+-- context.lua
+-- Cache of the agent context snapshot, kept up to date by the python host
+local M = {}
+
+local state = {
+  version = nil,
+  data = nil,
+  buffers_by_path = {},
+  files_by_path = {},
+}
+
+-- Called by the python host whenever the context changes
+function M.update(snapshot)
+  if not snapshot.data then
+    return
+  end
+
+  state.version = snapshot.version
+  state.data = snapshot.data
+
+  -- Index by full path so lookups don't scan the whole context
+  state.buffers_by_path = {}
+  for _, buf in ipairs(snapshot.data.buffers) do
+    state.buffers_by_path[vim.fn.fnamemodify(buf.name, ":p")] = buf
+  end
+  state.files_by_path = {}
+  for _, file in ipairs(snapshot.data.files) do
+    state.files_by_path[vim.fn.fnamemodify(file, ":p")] = true
+  end
+end
+
+-- Fetch the snapshot only if nothing was pushed yet or the cached version is stale
+function M.refresh()
+  M.update(vim.fn.AgentContextGetSnapshot(state.version or -1))
+end
+
+function M.get()
+  if not state.data then
+    M.refresh()
+  end
+  return state.data
+end
+
+function M.get_buffer(full_path)
+  M.get()
+  return state.buffers_by_path[full_path]
+end
+
+function M.has_file(full_path)
+  M.get()
+  return state.files_by_path[full_path] ~= nil
+end
+
+return M
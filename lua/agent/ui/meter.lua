@@ -0,0 +1,10 @@
+-- meter.lua
+local M = {}
+
+-- Statusline component showing the estimated token count of the next request,
+-- e.g. lualine_x = { require("agent.ui.meter").statusline }
+M.statusline = function()
+  return vim.g.agent_token_meter or ""
+end
+
+return M
@@ -3,6 +3,7 @@ local builtin = require("telescope.builtin")
 local actions = require("telescope.actions")
 local action_state = require("telescope.actions.state")
 local previewers = require("telescope.previewers")
+local context = require("agent.context")
 
 -- Custom previewer for context menu
 local context_previewer = previewers.new_buffer_previewer({
@@ -12,8 +13,8 @@ local context_previewer = previewers.new_buffer_previewer({
     local bufnr = self.state.bufnr
     local win = self.state.winid
 
-    -- Call back to get context data
-    local context_data = vim.fn.AgentContextGetData()
+    -- Get cached context data, only fetched from python when the version changed
+    local context_data = context.get()
     if not context_data then
       return
     end
@@ -105,37 +106,17 @@ M.file_picker_with_context = function()
       preview_width = 0.5,
     },
     path_display = function(_, path)
-      -- Get context data to check file status
-      local context_data = vim.fn.AgentContextGetData()
+      -- Check file status against the cached context data
       local full_path = vim.fn.fnamemodify(path, ":p")
       local relative_path = vim.fn.fnamemodify(path, ":.")
 
       -- First check if it's a buffer (whether active or not)
-      local is_buffer = false
-      local is_active = false
-      for _, buf in ipairs(context_data.buffers) do
-        if vim.fn.fnamemodify(buf.name, ":p") == full_path then
-          is_buffer = true
-          is_active = buf.active
-          break
-        end
-      end
-
-      -- Only check additional_files if it's not a buffer
-      local is_added = false
-      if not is_buffer then
-        for _, file in ipairs(context_data.files) do
-          if vim.fn.fnamemodify(file, ":p") == full_path then
-            is_added = true
-            break
-          end
-        end
-      end
+      local buf = context.get_buffer(full_path)
 
       -- Add appropriate status indicator
-      if is_buffer then
-        return (is_active and "✓" or "☐") .. " " .. relative_path
-      elseif is_added then
+      if buf then
+        return (buf.active and "✓" or "☐") .. " " .. relative_path
+      elseif context.has_file(full_path) then
         return "✓ " .. relative_path
       else
         return "☐ " .. relative_path
@@ -147,19 +128,11 @@ M.file_picker_with_context = function()
         local selection = action_state.get_selected_entry()
         local full_path = vim.fn.fnamemodify(selection.value, ":p")
 
-        -- Check if this is a buffer first
-        local context_data = vim.fn.AgentContextGetData()
-        local is_buffer = false
-        for _, buf in ipairs(context_data.buffers) do
-          if vim.fn.fnamemodify(buf.name, ":p") == full_path then
-            vim.fn.AgentContextToggleBuffer(buf.number)
-            is_buffer = true
-            break
-          end
-        end
-
-        -- Only add to additional files if it's not a buffer
-        if not is_buffer then
+        -- Check if this is a buffer first, only add to additional files if it's not
+        local buf = context.get_buffer(full_path)
+        if buf then
+          vim.fn.AgentContextToggleBuffer(buf.number)
+        else
           vim.fn.AgentContextAddFile(full_path)
         end
 
@@ -172,12 +145,11 @@ M.file_picker_with_context = function()
         local full_path = vim.fn.fnamemodify(selection.value, ":p")
 
         -- Check if this is a buffer first
-        for _, buf in ipairs(vim.fn.AgentContextGetData().buffers) do
-          if vim.fn.fnamemodify(buf.name, ":p") == full_path then
-            vim.fn.AgentContextToggleBuffer(buf.number)
-            refresh_picker(prompt_bufnr)
-            return
-          end
+        local buf = context.get_buffer(full_path)
+        if buf then
+          vim.fn.AgentContextToggleBuffer(buf.number)
+          refresh_picker(prompt_bufnr)
+          return
         end
 
         -- If not a buffer, treat as additional file
@@ -1,10 +1,13 @@
 import asyncio
 import logging
+import os
+import threading
 from datetime import datetime
 from typing import Dict, List
 
 import pynvim
 
+from .batch import DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE, BatchRunner, expand_glob, get_batch_output_dir
 from .chat import ChatInterface
 from .context import AgentContext
 from .mcp import MCPClient
@@ -17,9 +20,9 @@ logger = logging.getLogger(__name__)
 class AgentPlugin:
     def __init__(self, nvim: pynvim.Nvim):
         self.nvim = nvim
+        setup_logger(self.nvim.vars.get("agent_config", {}).get("log", {}))
         self.context = AgentContext(nvim)
         self.chat_interface = ChatInterface(nvim, self.context)
-        setup_logger()
 
     @pynvim.command("AgentDebug", nargs=0, sync=True)
     def debug_info(self):
@@ -45,6 +48,10 @@ class AgentPlugin:
     def send_message_stream(self, args: List[str]):
         self.nvim.async_call(self.chat_interface.send_message_stream)
 
+    @pynvim.function("AgentTokenMeterUpdate")
+    def update_token_meter(self, args: List[str]):
+        self.chat_interface.update_token_meter()
+
     @pynvim.function("AgentClose", sync=True)
     def close_chat(self, args: List[str]):
         self.chat_interface.close_chat()
@@ -53,6 +60,47 @@ class AgentPlugin:
     def clean_chat(self, args: List[str]):
         self.chat_interface.clean_chat()
 
+    @pynvim.autocmd("BufEnter", pattern="*")
+    def on_buf_enter(self):
+        self.chat_interface.prefetcher.schedule(delay_ms=0)
+
+    @pynvim.autocmd("BufWritePost", pattern="*", eval='expand("<afile>:p")')
+    def on_buf_write_post(self, file_path: str):
+        self.chat_interface.prefetcher.schedule(delay_ms=0)
+        self.chat_interface.index.update_file(file_path)
+
+    @pynvim.autocmd("FocusGained", pattern="*")
+    def on_focus_gained(self):
+        self.chat_interface.index.refresh()
+
+    @pynvim.autocmd("DirChanged", pattern="*", eval="getcwd()")
+    def on_dir_changed(self, cwd: str):
+        self.chat_interface.index.change_root(cwd)
+
+    @pynvim.autocmd("TextChanged", pattern="*")
+    def on_text_changed(self):
+        self.chat_interface.prefetcher.schedule()
+
+    @pynvim.autocmd("BufAdd", pattern="*", eval='expand("<abuf>")')
+    def on_buf_add(self, buf_number: str):
+        self.context.update_buffer(int(buf_number))
+
+    @pynvim.autocmd("BufFilePost", pattern="*", eval='expand("<abuf>")')
+    def on_buf_file_post(self, buf_number: str):
+        self.context.update_buffer(int(buf_number))
+
+    @pynvim.autocmd("FileType", pattern="*", eval='expand("<abuf>")')
+    def on_file_type(self, buf_number: str):
+        self.context.update_buffer(int(buf_number))
+
+    @pynvim.autocmd("BufDelete", pattern="*", eval='expand("<abuf>")')
+    def on_buf_delete(self, buf_number: str):
+        self.context.remove_buffer(int(buf_number))
+
+    @pynvim.autocmd("BufWipeout", pattern="*", eval='expand("<abuf>")')
+    def on_buf_wipeout(self, buf_number: str):
+        self.context.remove_buffer(int(buf_number))
+
     @pynvim.command("AgentContext", sync=True)
     def show_context_picker(self):
         self.nvim.command('lua require("agent.ui.telescope").file_picker_with_context()')
@@ -61,6 +109,11 @@ class AgentPlugin:
     def get_context_data(self, args: List[str]) -> Dict:
         return self.context.get_context_data()
 
+    @pynvim.function("AgentContextGetSnapshot", sync=True)
+    def get_context_snapshot(self, args: List[int]) -> Dict:
+        version = args[0] if args else None
+        return self.context.get_snapshot(version)
+
     @pynvim.function("AgentContextAddFile", sync=True)
     def add_file(self, args: List[str]):
         if args and len(args) > 0:
@@ -89,6 +142,64 @@ class AgentPlugin:
         if args and len(args) > 0:
             self.context.toggle_buffer(int(args[0]))
 
+    @pynvim.command("AgentIndexBuild", sync=True)
+    def build_index(self):
+        """Re-walk the workspace and update the symbol index"""
+        if not self.chat_interface.index.enabled:
+            self.nvim.err_write("Workspace index is disabled, enable it with agent_config.index.enabled\n")
+            return
+        self.chat_interface.index.rebuild()
+
+    @pynvim.command("AgentBatch", nargs="+", sync=True)
+    def run_batch(self, args: List[str]):
+        """Run a prompt against every file matching a glob, e.g. :AgentBatch src/**/*.py add type hints"""
+        if len(args) < 2:
+            self.nvim.err_write("Usage: :AgentBatch {glob} {prompt}\n")
+            return
+
+        pattern, prompt = args[0], " ".join(args[1:])
+        root = self.nvim.funcs.getcwd()
+        file_paths = expand_glob(pattern, root)
+        if not file_paths:
+            self.nvim.err_write(f"No files match {pattern}\n")
+            return
+
+        batch_config = self.nvim.vars.get("agent_config", {}).get("batch", {})
+        base_dir = batch_config.get("output_dir") or os.path.join(self.nvim.funcs.stdpath("cache"), "agent", "batch")
+        output_dir = get_batch_output_dir(os.path.expanduser(base_dir), root, pattern, prompt)
+        self.nvim.funcs.setqflist([], "r", {"title": f"AgentBatch: {prompt}", "items": []})
+
+        def add_result(result):
+            text = f"error: {result.error}" if result.error else f"done: {os.path.relpath(result.file_path, root)}"
+            item = {"filename": result.output_path or result.file_path, "lnum": 1, "text": text}
+            self.nvim.async_call(self.nvim.funcs.setqflist, [], "a", {"items": [item]})
+
+        runner = BatchRunner(
+            self.chat_interface.llm_provider,
+            file_paths,
+            prompt,
+            output_dir,
+            root,
+            concurrency=batch_config.get("concurrency", DEFAULT_CONCURRENCY),
+            requests_per_minute=batch_config.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE),
+            on_result=add_result,
+        )
+
+        def run():
+            try:
+                results = runner.run()
+            except Exception as e:
+                logger.error(f"AgentBatch failed: {str(e)}")
+                self.nvim.async_call(self.nvim.err_write, f"AgentBatch failed: {str(e)}\n")
+                return
+            failed = sum(1 for result in results if result.error)
+            summary = f"AgentBatch finished: {len(results) - failed} done, {failed} failed, outputs in {output_dir}\n"
+            self.nvim.async_call(self.nvim.out_write, summary)
+            self.nvim.async_call(self.nvim.command, "copen")
+
+        self.nvim.out_write(f"AgentBatch started on {len(file_paths)} files\n")
+        threading.Thread(target=run, daemon=True).start()
+
     @pynvim.function("AgentListConversations", sync=True)
     def list_conversations(self, args) -> List[Dict]:
         conversations = self.chat_interface.storage.list_conversations()
@@ -184,12 +295,12 @@ class AgentPlugin:
                 tools_response = await session.list_tools()
                 logger.debug("Available tools:")
                 for tool in tools_response.tools:
-                    logger.debug(f"- {tool.name}: {tool.description}")
+                    logger.debug("- %s: %s", tool.name, tool.description)
 
                 # Try calling echo_tool if available
                 if any(tool.name == "echo_tool" for tool in tools_response.tools):
                     result = await session.call_tool("echo_tool", {"message": "MCP test successful!"})
-                    logger.debug(f"Test tool call result: {result.content}")
+                    logger.debug("Test tool call result: %s", result.content)
 
                 logger.debug("-- run test end --")
             except Exception as e:
@@ -0,0 +1,225 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from .llm.base import LLMProvider
+from .llm.constants import BASE_SYSTEM_PROMPT, FILE_CONTEXT_SYSTEM_PROMPT, create_file_prompt_from_file
+from .llm.factory import LLMProviderFactory
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 50
+CHECKPOINT_FILE = ".agent_batch_checkpoint"
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessFuncs:
+    def stdpath(self, what: str) -> str:
+        # the default locations of Neovim, so headless runs share its cache
+        if what == "cache":
+            return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "nvim")
+        raise ValueError(f"Unsupported stdpath in headless mode: {what}")
+
+
+class HeadlessNvim:
+    """Stand-in for the editor handle so providers can run outside of Neovim"""
+
+    def __init__(self, agent_config: Optional[Dict] = None):
+        self.vars = {"agent_config": agent_config or {}}
+        self.funcs = HeadlessFuncs()
+
+    def out_write(self, message: str):
+        sys.stdout.write(message)
+
+    def err_write(self, message: str):
+        sys.stderr.write(message)
+
+    def async_call(self, fn: Callable, *args):
+        fn(*args)
+
+
+class BatchResult:
+    def __init__(self, file_path: str, output_path: Optional[str], error: Optional[str] = None):
+        self.file_path = file_path
+        self.output_path = output_path
+        self.error = error
+
+
+class RateLimiter:
+    """Spaces request starts evenly to stay under a requests per minute limit"""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60 / requests_per_minute if requests_per_minute > 0 else 0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def expand_glob(pattern: str, root: str) -> List[str]:
+    """Expand a glob relative to `root` into a sorted list of absolute file paths"""
+    matches = glob.glob(pattern, root_dir=root, recursive=True)
+    file_paths = [os.path.normpath(os.path.join(root, match)) for match in matches]
+    return sorted(file_path for file_path in file_paths if os.path.isfile(file_path))
+
+
+def get_batch_output_dir(base_dir: str, root: str, pattern: str, prompt: str) -> str:
+    """Output directory of a batch, stable for the same project, glob and prompt so reruns resume"""
+    batch_hash = hashlib.sha1(f"{root}\0{pattern}\0{prompt}".encode()).hexdigest()[:12]
+    return os.path.join(base_dir, f"batch_{batch_hash}")
+
+
+def create_batch_system_prompt(file_path: str) -> Optional[str]:
+    file_context = create_file_prompt_from_file(file_path)
+    if file_context is None:
+        return None
+    return f"{BASE_SYSTEM_PROMPT} {FILE_CONTEXT_SYSTEM_PROMPT.replace('{{FILES}}', file_context)}"
+
+
+class BatchRunner:
+    """Runs one prompt against many files on a bounded worker pool.
+
+    Each file gets its own request with the file as context, and the response is streamed to
+    `<output_dir>/<relative path>.md`. Completed files are appended to a checkpoint in the
+    output directory, so an interrupted batch resumes with the remaining files.
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        file_paths: List[str],
+        prompt: str,
+        output_dir: str,
+        root: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+        on_result: Optional[Callable[[BatchResult], None]] = None,
+    ):
+        self.provider = provider
+        self.file_paths = file_paths
+        self.prompt = prompt
+        self.output_dir = output_dir
+        self.root = root
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.on_result = on_result
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self._checkpoint_lock = threading.Lock()
+
+    def _load_checkpoint(self) -> Set[str]:
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return {json.loads(line) for line in f if line.strip()}
+        except (OSError, ValueError):
+            return set()
+
+    def _mark_done(self, file_path: str):
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, "a") as f:
+                f.write(json.dumps(file_path) + "\n")
+
+    def _get_output_path(self, file_path: str) -> str:
+        rel_path = os.path.relpath(file_path, self.root)
+        if rel_path.startswith(".."):
+            rel_path = file_path.lstrip(os.sep)
+        return os.path.join(self.output_dir, f"{rel_path}.md")
+
+    def run(self) -> List[BatchResult]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        done = self._load_checkpoint()
+        pending = [file_path for file_path in self.file_paths if file_path not in done]
+        logger.debug("Batch: %d files, %d already done", len(self.file_paths), len(self.file_paths) - len(pending))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="agent-batch") as executor:
+            return list(executor.map(self._process, pending))
+
+    def _process(self, file_path: str) -> BatchResult:
+        result = self._run_request(file_path)
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def _run_request(self, file_path: str) -> BatchResult:
+        system_prompt = create_batch_system_prompt(file_path)
+        if system_prompt is None:
+            return BatchResult(file_path, None, "could not read file")
+
+        output_path = self._get_output_path(file_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        self.rate_limiter.wait()
+        try:
+            with open(output_path, "w") as f:
+                messages = [{"role": "user", "content": self.prompt}]
+                for text in self.provider.complete_stream(messages=messages, system_prompt=system_prompt):
+                    f.write(text)
+                    f.flush()
+        except Exception as e:
+            logger.error(f"Batch request failed for {file_path}: {str(e)}")
+            return BatchResult(file_path, output_path, str(e))
+
+        self._mark_done(file_path)
+        return BatchResult(file_path, output_path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="agent.batch", description="Apply a prompt to many files concurrently.")
+    parser.add_argument("pattern", help='file glob, e.g. "src/**/*.py"')
+    parser.add_argument("prompt", help="prompt to run against each file")
+    parser.add_argument("--output-dir", default="agent-batch", help="base directory for the per-file outputs")
+    parser.add_argument("--provider", default="anthropic", help="model provider: anthropic, bedrock or cassette")
+    parser.add_argument("--region", default=None, help="bedrock region")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE)
+    parser.add_argument("--config", default=None, help="JSON file with an agent_config table, e.g. transport")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+
+    agent_config = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            agent_config = json.load(f)
+
+    root = os.getcwd()
+    file_paths = expand_glob(args.pattern, root)
+    if not file_paths:
+        sys.stderr.write(f"No files match {args.pattern}\n")
+        return 1
+
+    provider = LLMProviderFactory.create(HeadlessNvim(agent_config), args.provider, region=args.region)
+    output_dir = get_batch_output_dir(args.output_dir, root, args.pattern, args.prompt)
+
+    def report(result: BatchResult):
+        status = f"error: {result.error}" if result.error else result.output_path
+        sys.stdout.write(f"{os.path.relpath(result.file_path, root)} -> {status}\n")
+
+    runner = BatchRunner(
+        provider,
+        file_paths,
+        args.prompt,
+        output_dir,
+        root,
+        concurrency=args.concurrency,
+        requests_per_minute=args.requests_per_minute,
+        on_result=report,
+    )
+    results = runner.run()
+    return 1 if any(result.error for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,43 @@
 import logging
+import threading
 import uuid
-from typing import Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import pynvim
 
 from .context import AgentContext
+from .context_diff import DEFAULT_MAX_DIFF_RATIO, BufferDiffTracker
+from .index import WorkspaceIndex
 from .llm.constants import (
     BASE_SYSTEM_PROMPT,
+    BUFFER_DIFF_SYSTEM_PROMPT,
     FILE_CONTEXT_SYSTEM_PROMPT,
+    TURN_CONTEXT_PROMPT,
     create_file_prompt_from_buf,
     create_file_prompt_from_file,
 )
 from .llm.factory import LLMProviderFactory
+from .llm.transport import get_transport_config
+from .messages import DEFAULT_MAX_MESSAGES, Message, MessageStore
+from .prefetch import ContextPrefetcher, ContextSnapshot
+from .render import (
+    RENDER_MARKDOWN,
+    STREAMING,
+    WRITE_LINES_LUA,
+    StreamingMarkdownRenderer,
+    clear_marks,
+    define_highlights,
+    highlight_markdown,
+    set_marks,
+)
 from .storage import ConversationStorage
+from .tokens import CHARS_PER_TOKEN, DEFAULT_ENCODING, TokenCounter, format_tokens
+
+# lines before the content of a message: separator, role, separator, blank
+MESSAGE_HEADER_LINES = 4
+# conversations whose buffer diff state is kept
+MAX_DIFF_TRACKERS = 8
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +45,6 @@ logger = logging.getLogger(__name__)
 class ChatInterface:
     def __init__(self, nvim: pynvim.Nvim, context: AgentContext):
         self.nvim = nvim
-        self.messages = []
         self.chat_win = None
         self.chat_buf = None
         self.input_win = None
@@ -30,31 +54,112 @@ class ChatInterface:
         self.is_active = False
         self.llm_provider = LLMProviderFactory.create(self.nvim)
         self.storage = ConversationStorage(self.nvim)
+        self.messages = MessageStore(self._load_stored_messages, self._get_max_messages())
+        # tokens of the messages spilled from memory, still part of every request
+        self._spilled_tokens = 0
+        self.diff_context_enabled, self.max_diff_ratio = self._get_diff_context_config()
+        # in diff mode buffers are not part of the system prompt, so their edits do not invalidate it
+        self.prefetcher = ContextPrefetcher(
+            self.nvim,
+            self.context,
+            self._build_system_prompt_blocks,
+            include_buffers=not self.diff_context_enabled,
+        )
+        self.diff_trackers: OrderedDict[str, BufferDiffTracker] = OrderedDict()
+        self.index = WorkspaceIndex(self.nvim)
+        # files added by the index in auto mode, oldest first, with their estimated tokens
+        self._indexed_files: OrderedDict[str, int] = OrderedDict()
+        self.token_counter = self._create_token_counter()
+        # token count of the system prompt by the snapshot it was counted for
+        self._system_tokens: Tuple[Optional[ContextSnapshot], int] = (None, 0)
+        # counter version the token counts cached on the messages were taken with
+        self._tokens_version = 0
+        self.render_mode = self._get_render_mode()
+        # messages shown in the chat buffer and the line where the content of the last one starts
+        self._displayed_messages = 0
+        self._last_message_start = 0
+
+    def _get_max_messages(self) -> int:
+        # without storage spilled messages could not be reloaded, so all are kept
+        if not self.storage.storage_enabled:
+            return 0
+        agent_config = self.nvim.vars.get("agent_config", {})
+        return agent_config.get("history", {}).get("max_messages", DEFAULT_MAX_MESSAGES)
+
+    def _load_stored_messages(self) -> Optional[List[Dict]]:
+        return self.storage.load_conversation(self.current_conversation_id)
+
+    def _get_render_mode(self) -> str:
+        agent_config = self.nvim.vars.get("agent_config", {})
+        return agent_config.get("render", {}).get("mode", RENDER_MARKDOWN)
+
+    def _create_token_counter(self) -> Optional[TokenCounter]:
+        agent_config = self.nvim.vars.get("agent_config", {})
+        token_meter = agent_config.get("token_meter", {})
+        if not token_meter.get("enabled", True):
+            return None
+        return TokenCounter(token_meter.get("encoding", DEFAULT_ENCODING))
+
+    def _get_diff_context_config(self) -> Tuple[bool, float]:
+        agent_config = self.nvim.vars.get("agent_config", {})
+        diff = agent_config.get("context", {}).get("diff", {})
+        enabled = diff.get("enabled", False)
+        max_ratio = diff.get("max_ratio", DEFAULT_MAX_DIFF_RATIO)
+        return enabled, max_ratio
 
     def _start_new_conversation(self):
         """Start a new conversation with a unique ID and initial system prompt."""
         self.current_conversation_id = str(uuid.uuid4())
-        self.messages = []
+        self.messages.clear()
+        self._spilled_tokens = 0
 
-        # Add and store initial system prompt
+        # Store initial system prompt
         system_prompt = self._get_system_prompt_with_context()
-        storage_messages = [{"role": "system", "content": system_prompt}]
-        self.storage.save_conversation(self.current_conversation_id, storage_messages)
+        self.storage.save_conversation(self.current_conversation_id, [], system_prompt)
 
-        logger.debug(
-            f"Started new conversation with ID: {
-                self.current_conversation_id}"
-        )
+        logger.debug("Started new conversation with ID: %s", self.current_conversation_id)
 
-    def _save_current_conversation(self):
+    def _save_current_conversation(self, system_prompt: Optional[str] = None):
         """Save the current conversation to storage."""
         if self.current_conversation_id and self.messages:
-            self.storage.save_conversation(self.current_conversation_id, self.messages)
+            # spilled messages are already in the file, only the ones in memory are rewritten
+            messages = [msg.to_dict() for msg in self.messages]
+            self.storage.save_conversation(
+                self.current_conversation_id, messages, system_prompt, start=self.messages.spilled
+            )
+            self._spill_messages()
+
+    def _spill_messages(self):
+        """Drop the oldest saved messages from memory and from the chat display."""
+        spilled = self.messages.spill()
+        if not spilled:
+            return
+        if self.token_counter:
+            self._spilled_tokens += sum(self._count_message_tokens(msg) for msg in spilled)
+
+        chat_buf_valid = self.chat_buf and self.chat_buf.valid
+        if not chat_buf_valid or self._displayed_messages < len(spilled):
+            # redraw without the spilled messages on the next update
+            self._displayed_messages = 0
+            return
+
+        # the spilled messages are the first ones shown, drop their lines below the note line
+        line_count = sum(len(self._format_message_lines(msg, 0)) for msg in spilled)
+        self.chat_buf.options["modifiable"] = True
+        self.chat_buf[0 : 1 + line_count] = [self._get_spilled_note()]
+        self.chat_buf.options["modifiable"] = False
+        self._displayed_messages -= len(spilled)
+        self._last_message_start -= line_count
+
+    def _get_spilled_note(self) -> str:
+        return f"_{self.messages.spilled} earlier messages not shown_" if self.messages.spilled else ""
 
     def create_chat_panel(self):
         self._create_chat_buffers()
         self._create_chat_windows()
         self._show_chat_windows()
+        if get_transport_config(self.nvim)["preconnect"]:
+            threading.Thread(target=self.llm_provider.warm_up, daemon=True).start()
 
     def _set_chat_buf_keymaps(self):
         opts = {"noremap": True, "silent": True}
@@ -72,6 +177,9 @@ class ChatInterface:
         self.chat_buf.options["buftype"] = "nofile"
         self.chat_buf.options["modifiable"] = False
         self.chat_buf.options["filetype"] = "markdown"
+        self._displayed_messages = 0
+        if self.render_mode == STREAMING:
+            define_highlights(self.nvim)
 
         self.input_buf = self.nvim.api.create_buf(False, True)
         self.input_buf.options["buftype"] = "nofile"
@@ -79,6 +187,9 @@ class ChatInterface:
         self.input_buf.options["filetype"] = "agent.nvim"
         self.input_buf.name = " "
         self._set_chat_buf_keymaps()
+        self.nvim.command(
+            f"autocmd TextChanged,TextChangedI <buffer={self.input_buf.number}> call AgentTokenMeterUpdate()"
+        )
 
     def _create_chat_windows(self):
         # Create the vertical split for chat
@@ -108,6 +219,7 @@ class ChatInterface:
         # Focus input window
         self.nvim.current.window = self.input_win
         self.nvim.command("startinsert")
+        self.update_token_meter()
 
     def show_chat(self):
         self.is_active = True
@@ -151,30 +263,124 @@ class ChatInterface:
             return
 
         window_width = self.nvim.api.win_get_width(self.chat_win)
-        display_lines = [""]
-        for msg in self.messages:
-            role = msg["role"].upper()
-            heading = "#" if role == "USER" else "##"
-            padding = " " * ((window_width - len(role) - len(heading)) // 2)
-            role_header = f"{heading}{padding}{role}{padding}"
 
-            display_lines.append("---")
-            display_lines.append(role_header)
-            display_lines.append("---")
-            display_lines.append("")
+        # the messages already shown are kept and only new ones appended
+        if 0 < self._displayed_messages <= len(self.messages):
+            self._append_chat_display(window_width)
+            return
 
-            wrapped_content = msg["content"].split("\n")
-            for line in wrapped_content:
-                display_lines.append(line)
-            display_lines.append("")
+        display_lines = [self._get_spilled_note()]
+        marks = []
+        for msg in self.messages:
+            self._last_message_start = len(display_lines) + MESSAGE_HEADER_LINES
+            msg_lines = self._format_message_lines(msg, window_width)
+            if self.render_mode == STREAMING and msg["role"] == "assistant":
+                marks += highlight_markdown(msg_lines[MESSAGE_HEADER_LINES:-1], self._last_message_start)
+            display_lines += msg_lines
 
         self.chat_buf.options["modifiable"] = True
         self.chat_buf[:] = display_lines
         self.chat_buf.options["modifiable"] = False
+        self._displayed_messages = len(self.messages)
+
+        if self.render_mode == STREAMING:
+            clear_marks(self.nvim, self.chat_buf)
+            set_marks(self.nvim, self.chat_buf, marks)
 
         # Scroll to bottom
         self.chat_win.cursor = (len(display_lines), 0)
 
+    def _append_chat_display(self, window_width: int):
+        """Append the messages not shown yet, highlighting only their lines in streaming mode."""
+        start = len(self.chat_buf)
+        display_lines = []
+        marks = []
+        for msg in self.messages[self._displayed_messages :]:
+            self._last_message_start = start + len(display_lines) + MESSAGE_HEADER_LINES
+            msg_lines = self._format_message_lines(msg, window_width)
+            if self.render_mode == STREAMING and msg["role"] == "assistant":
+                marks += highlight_markdown(msg_lines[MESSAGE_HEADER_LINES:-1], self._last_message_start)
+            display_lines += msg_lines
+
+        if display_lines:
+            self.nvim.exec_lua(WRITE_LINES_LUA, self.chat_buf, self.chat_win, start, display_lines)
+            set_marks(self.nvim, self.chat_buf, marks)
+        self._displayed_messages = len(self.messages)
+
+    def _format_message_lines(self, msg: Message, window_width: int) -> List[str]:
+        role = msg["role"].upper()
+        heading = "#" if role == "USER" else "##"
+        padding = " " * ((window_width - len(role) - len(heading)) // 2)
+        role_header = f"{heading}{padding}{role}{padding}"
+
+        return ["---", role_header, "---", "", *msg["content"].split("\n"), ""]
+
+    def _start_stream_render(self) -> Optional[StreamingMarkdownRenderer]:
+        """Show the header of the new assistant message and render its content as it streams."""
+        if not (self.chat_buf and self.chat_buf.valid and self.chat_win and self.chat_win.valid):
+            return None
+        self._update_chat_display()
+        return StreamingMarkdownRenderer(
+            self.nvim,
+            self.chat_buf,
+            self.chat_win,
+            self._last_message_start,
+            highlight=self.render_mode == STREAMING,
+        )
+
+    def update_token_meter(self):
+        """Show the estimated token count of the next request in the input window and statusline."""
+        if not self.token_counter:
+            return
+
+        # the estimates cached so far are replaced once the encoding is loaded
+        if self.token_counter.version != self._tokens_version:
+            self._tokens_version = self.token_counter.version
+            self._system_tokens = (None, 0)
+            for msg in self.messages:
+                msg.tokens = None
+
+        # system prompt and history counts are cached, so while typing only the draft is counted
+        system_tokens = self._count_system_tokens()
+        history_tokens = self._spilled_tokens + sum(self._count_message_tokens(msg) for msg in self.messages)
+        draft_tokens = 0
+        if self.input_buf and self.input_buf.valid:
+            draft_tokens = self.token_counter.count_blocks(self.input_buf[:])
+
+        total_tokens = system_tokens + history_tokens + draft_tokens
+        parts = f"system {format_tokens(system_tokens)}, history {format_tokens(history_tokens)}"
+        if self.diff_context_enabled:
+            buffer_tokens = self._estimate_unseen_buffer_tokens()
+            total_tokens += buffer_tokens
+            parts += f", buffers {format_tokens(buffer_tokens)}"
+        meter = f"tokens: {format_tokens(total_tokens)} ({parts}, draft {format_tokens(draft_tokens)})"
+        self.nvim.vars["agent_token_meter"] = meter
+        if self.input_win and self.input_win.valid:
+            self.input_win.options["winbar"] = meter
+
+    def _count_system_tokens(self) -> int:
+        snapshot = self.prefetcher.peek_snapshot()
+        if snapshot is None:
+            return 0
+        counted_snapshot, tokens = self._system_tokens
+        if snapshot is not counted_snapshot:
+            tokens = self.token_counter.count_blocks(snapshot.blocks)
+            self._system_tokens = (snapshot, tokens)
+        return tokens
+
+    def _estimate_unseen_buffer_tokens(self) -> int:
+        """Estimate the buffers the next message attaches in full in diff mode, from their size."""
+        active_bufs = self.context.get_active_buffers()
+        tracker = self.diff_trackers.get(self.current_conversation_id)
+        unseen = tracker.get_unseen(active_bufs) if tracker else active_bufs
+        sizes = self.context.get_buffer_sizes([buf.number for buf in unseen])
+        return sum(size // CHARS_PER_TOKEN for size in sizes)
+
+    def _count_message_tokens(self, msg: Message) -> int:
+        if msg.tokens is None:
+            msg.tokens = self.token_counter.count(msg.content) + self.token_counter.count(msg.get("context", ""))
+        return msg.tokens
+
     def _get_input_buf_contents(self) -> Optional[str]:
         if not self.input_buf or not self.input_buf.valid:
             return
@@ -184,9 +390,16 @@ class ChatInterface:
         return message.strip()
 
     def _get_system_prompt_with_context(self):
-        """Get system prompt with current buffer and file contexts."""
-        active_bufs = self.context.get_active_buffers()
-        buf_contexts = [create_file_prompt_from_buf(buf) for buf in active_bufs]
+        """Get system prompt with current buffer and file contexts, reusing the prefetched snapshot."""
+        return self.prefetcher.get_prompt()
+
+    def _build_system_prompt_blocks(self) -> List[str]:
+        """Build system prompt with current buffer and file contexts, one block per file."""
+        # in diff mode buffers are attached to the user messages instead
+        buf_contexts = []
+        if not self.diff_context_enabled:
+            active_bufs = self.context.get_active_buffers()
+            buf_contexts = [create_file_prompt_from_buf(buf) for buf in active_bufs]
 
         files = self.context.get_additional_files()
         file_contexts = [
@@ -195,28 +408,96 @@ class ChatInterface:
 
         all_file_contexts = buf_contexts + file_contexts
 
+        system_prompt = BASE_SYSTEM_PROMPT
+        if self.diff_context_enabled:
+            system_prompt = f"{system_prompt} {BUFFER_DIFF_SYSTEM_PROMPT}"
+
         if not all_file_contexts:
-            return BASE_SYSTEM_PROMPT
+            return [system_prompt]
+
+        files_header, files_footer = FILE_CONTEXT_SYSTEM_PROMPT.split("{{FILES}}")
+        return [f"{system_prompt} {files_header}", *all_file_contexts, files_footer]
 
-        files_content = "".join(all_file_contexts)
-        return f"{BASE_SYSTEM_PROMPT} {FILE_CONTEXT_SYSTEM_PROMPT.replace("{{FILES}}", files_content)}"
+    def _add_indexed_files(self, message: str):
+        """Suggest or add the files defining the identifiers mentioned in the message."""
+        if not self.index.enabled:
+            return
+
+        in_context = set(self.context.get_additional_files())
+        in_context.update(ctx_buf.name for ctx_buf in self.context.active_buffers.values() if ctx_buf.is_active)
+        file_paths = self.index.find_files(message, in_context)
+        if not file_paths:
+            return
+
+        if self.index.mode == "auto":
+            self._add_auto_indexed_files(file_paths)
+        else:
+            relative_paths = ", ".join(self.nvim.funcs.fnamemodify(file_path, ":.") for file_path in file_paths)
+            self.nvim.out_write(f"Files defining mentioned symbols: {relative_paths} (add with :AgentContext)\n")
+
+    def _add_auto_indexed_files(self, file_paths: List[str]):
+        """Add indexed files to the context, dropping the oldest ones added before over the token budget."""
+        # files removed from the context by hand no longer count
+        in_context = set(self.context.get_additional_files())
+        for file_path in [file_path for file_path in self._indexed_files if file_path not in in_context]:
+            del self._indexed_files[file_path]
+
+        for file_path in file_paths:
+            self.context.add_file(file_path)
+            self._indexed_files[file_path] = self.index.estimate_tokens(file_path)
+
+        tokens = sum(self._indexed_files.values())
+        while tokens > self.index.token_budget and len(self._indexed_files) > len(file_paths):
+            file_path, file_tokens = self._indexed_files.popitem(last=False)
+            self.context.remove_file(file_path)
+            tokens -= file_tokens
+
+    def _get_buffer_diff_context(self) -> str:
+        """Get the buffer contexts the model has not seen yet in the current conversation."""
+        tracker = self.diff_trackers.get(self.current_conversation_id)
+        if tracker is None:
+            tracker = BufferDiffTracker(self.max_diff_ratio)
+            self.diff_trackers[self.current_conversation_id] = tracker
+            # an evicted conversation starts over with the full buffers
+            if len(self.diff_trackers) > MAX_DIFF_TRACKERS:
+                self.diff_trackers.popitem(last=False)
+        else:
+            self.diff_trackers.move_to_end(self.current_conversation_id)
+
+        active_bufs = self.context.get_active_buffers()
+        ticks = self.context.get_changedticks([buf.number for buf in active_bufs])
+        return tracker.build_context(active_bufs, ticks)
+
+    def _get_request_messages(self) -> List[Dict]:
+        """Get the messages to send to the model, with attached contexts inlined."""
+        request_messages = []
+        for msg in self.messages.get_all():
+            if msg["role"] == "system":
+                continue
+            content = msg["content"]
+            if msg.get("context"):
+                content = TURN_CONTEXT_PROMPT.replace("{{FILES}}", msg["context"]).replace("{{MESSAGE}}", content)
+            request_messages.append({"role": msg["role"], "content": content})
+        return request_messages
 
     def send_message(self):
         message = self._get_input_buf_contents()
         if message:
             self.input_buf[:] = [""]
-            self.nvim.command("RenderMarkdown disable")
+            if self.render_mode == RENDER_MARKDOWN:
+                self.nvim.command("RenderMarkdown disable")
             self._add_message("user", message)
-            response = self.llm_provider.complete(self.messages)
+            response = self.llm_provider.complete(self._get_request_messages())
             if response:
                 self._add_message("assistant", response)
 
-        self.nvim.command("RenderMarkdown enable")
+        if self.render_mode == RENDER_MARKDOWN:
+            self.nvim.command("RenderMarkdown enable")
         self.nvim.current.window = self.chat_win
 
-    def _add_message(self, role: str, content: str):
+    def _add_message(self, role: str, content: str, context: Optional[str] = None):
         """Add a message and save the conversation."""
-        self.messages.append({"role": role, "content": content})
+        self.messages.append(role, content, context)
         self._save_current_conversation()
         self._update_chat_display()
 
@@ -227,34 +508,46 @@ class ChatInterface:
         message = self._get_input_buf_contents()
         if message:
             self.input_buf[:] = [""]
-            self.nvim.command("RenderMarkdown disable")
+            if self.render_mode == RENDER_MARKDOWN:
+                self.nvim.command("RenderMarkdown disable")
+
+            # Pull in the files defining mentioned symbols before the context is built
+            self._add_indexed_files(message)
 
             # Get system prompt
             system_prompt = self._get_system_prompt_with_context()
 
-            # Add user message to display messages
-            self._add_message("user", message)
+            # Add user message to display messages, with the buffer changes attached in diff mode
+            buffer_context = self._get_buffer_diff_context() if self.diff_context_enabled else None
+            self._add_message("user", message, buffer_context)
 
             # Get response using display messages but excluding system messages
-            display_messages = [msg for msg in self.messages if msg["role"] != "system"]
-            event_stream = self.llm_provider.complete_stream(messages=display_messages, system_prompt=system_prompt)
+            request_messages = self._get_request_messages()
+            event_stream = self.llm_provider.complete_stream(messages=request_messages, system_prompt=system_prompt)
 
-            assistant_content = ""
+            # chunks are only written to the tail of the chat buffer, the content is joined once at the end
+            assistant_msg = None
+            renderer = None
             for event in event_stream:
-                if self.messages[-1].get("role", "") == "user":
-                    self.messages.append({"role": "assistant", "content": ""})
+                if assistant_msg is None:
+                    assistant_msg = self.messages.append("assistant")
+                    renderer = self._start_stream_render()
 
-                assistant_content += event
-                self.messages[-1]["content"] = assistant_content
-                if self.chat_buf and self.chat_buf.valid and self.chat_win and self.chat_win.valid:
-                    self._update_chat_display()
+                assistant_msg.append(event)
+                if renderer:
+                    renderer.append(event)
+
+            if renderer:
+                renderer.finish()
+            elif self.chat_buf and self.chat_buf.valid and self.chat_win and self.chat_win.valid:
+                self._update_chat_display()
 
             # Save the complete conversation
-            if self.current_conversation_id:
-                storage_messages = [{"role": "system", "content": system_prompt}] + self.messages
-                self.storage.save_conversation(self.current_conversation_id, storage_messages)
+            self._save_current_conversation(system_prompt)
 
-        self.nvim.command("RenderMarkdown enable")
+        if self.render_mode == RENDER_MARKDOWN:
+            self.nvim.command("RenderMarkdown enable")
+        self.update_token_meter()
         if self.chat_win and self.chat_win.valid:
             self.nvim.current.window = self.chat_win
 
@@ -263,8 +556,11 @@ class ChatInterface:
         messages = self.storage.load_conversation(conversation_id)
         if messages:
             # Filter out system messages when loading
-            self.messages = [msg for msg in messages if msg["role"] != "system"]
+            self.messages.load(messages)
             self.current_conversation_id = conversation_id
+            self._spilled_tokens = 0
+            self._displayed_messages = 0
+            self._spill_messages()
 
             # Make sure chat interface is visible
             self.show_chat()
@@ -278,5 +574,6 @@ class ChatInterface:
     def clean_chat(self):
         self.close_chat()
         self._delete_chat_buffers()
-        self.messages = []
+        self.messages.clear()
+        self._displayed_messages = 0
         self._start_new_conversation()
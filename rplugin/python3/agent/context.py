@@ -1,19 +1,36 @@
 import logging
-from typing import Dict, List
+import os
+from typing import Dict, List, Optional, Tuple
 
 import pynvim
 from pynvim.api import Buffer
 
 IGNORED_BUF_FILE_TYPES = {"alpha", "unkown", "NvimTree", "TelescopePrompt", "TelescopeResult", "agent.nvim"}
 IGNORED_BUF_PATTERNS = {"agent chat"}
+GET_CHANGEDTICKS_LUA = """
+local ticks = {}
+for i, buf in ipairs(...) do
+  ticks[i] = vim.api.nvim_buf_get_changedtick(buf)
+end
+return ticks
+"""
+GET_BUFFER_SIZES_LUA = """
+local sizes = {}
+for i, buf in ipairs(...) do
+  sizes[i] = vim.api.nvim_buf_get_offset(buf, vim.api.nvim_buf_line_count(buf))
+end
+return sizes
+"""
+PUSH_SNAPSHOT_LUA = 'require("agent.context").update(...)'
 
 
 logger = logging.getLogger(__name__)
 
 
 class ContextBuf:
-    def __init__(self, buf: Buffer):
+    def __init__(self, buf: Buffer, name: str):
         self.buf = buf
+        self.name = name
         self.is_active = True
 
 
@@ -22,13 +39,52 @@ class AgentContext:
         self.nvim = nvim
         self.active_buffers: Dict[int, ContextBuf] = {}
         self.additional_files: List[str] = []
+        # bumped on every change, lets the picker skip re-fetching an unchanged snapshot
+        self.version = 0
+        self._context_data: Optional[Dict] = None
         self._refresh_active_buffers()
 
     def _refresh_active_buffers(self):
+        """Scan all buffers, later changes are tracked incrementally from buffer events"""
         for buf in self.nvim.buffers:
             if buf.valid and buf.name and not self._is_ignored_buffer(buf):
                 if buf.number not in self.active_buffers:
-                    self.active_buffers[buf.number] = ContextBuf(buf)
+                    self.active_buffers[buf.number] = ContextBuf(buf, buf.name)
+        self._changed()
+
+    def _changed(self):
+        """Invalidate the snapshot and push the new one to the editor"""
+        self.version += 1
+        self._context_data = None
+        try:
+            self.nvim.exec_lua(PUSH_SNAPSHOT_LUA, self.get_snapshot())
+        except Exception as e:
+            logger.debug("Failed to push context snapshot: %s", e)
+
+    def update_buffer(self, buf_number: int):
+        """Add, rename or drop a buffer after it was created, renamed or its filetype was set"""
+        try:
+            buf = self.nvim.buffers[buf_number]
+        except KeyError:
+            # already wiped out by the time the event is handled
+            return
+        ctx_buf = self.active_buffers.get(buf_number)
+        if self._is_ignored_buffer(buf):
+            if ctx_buf:
+                del self.active_buffers[buf_number]
+                self._changed()
+        elif not ctx_buf:
+            self.active_buffers[buf_number] = ContextBuf(buf, buf.name)
+            self._changed()
+        elif ctx_buf.name != buf.name:
+            ctx_buf.name = buf.name
+            self._changed()
+
+    def remove_buffer(self, buf_number: int):
+        """Drop a buffer that was deleted or wiped out"""
+        if buf_number in self.active_buffers:
+            del self.active_buffers[buf_number]
+            self._changed()
 
     def _is_ignored_buffer(self, buf: Buffer) -> bool:
         """Check if buffer should be ignored in context"""
@@ -41,22 +97,31 @@ class AgentContext:
 
     def get_context_data(self) -> Dict:
         """Get current context data in a format suitable for the previewer"""
-        self._refresh_active_buffers()
-        buffers = []
-        for buf_num, ctx_buf in self.active_buffers.items():
-            buffers.append({"number": buf_num, "name": ctx_buf.buf.name, "active": ctx_buf.is_active})
+        if self._context_data is None:
+            buffers = []
+            for buf_num, ctx_buf in self.active_buffers.items():
+                buffers.append({"number": buf_num, "name": ctx_buf.name, "active": ctx_buf.is_active})
+            self._context_data = {"buffers": buffers, "files": list(self.additional_files)}
+
+        return self._context_data
 
-        return {"buffers": buffers, "files": self.additional_files}
+    def get_snapshot(self, version: Optional[int] = None) -> Dict:
+        """Get the versioned context data, without the data if `version` is still current"""
+        if version == self.version:
+            return {"version": self.version}
+        return {"version": self.version, "data": self.get_context_data()}
 
     def add_file(self, file_path: str):
         """Add a file to the context"""
         if file_path and file_path not in self.additional_files:
             self.additional_files.append(file_path)
+            self._changed()
 
     def remove_file(self, file_path: str):
         """Remove a file from the context"""
         if file_path in self.additional_files:
             self.additional_files.remove(file_path)
+            self._changed()
 
     def get_additional_files(self) -> List[str]:
         return self.additional_files
@@ -64,18 +129,47 @@ class AgentContext:
     def clear_additional_files(self):
         """Clear all additional files from context"""
         self.additional_files = []
+        self._changed()
 
     def get_active_buffers(self) -> List[Buffer]:
-        self._refresh_active_buffers()
         return [ctx_buf.buf for ctx_buf in self.active_buffers.values() if ctx_buf.is_active]
 
+    def get_state_key(self, include_buffers: bool = True) -> Tuple:
+        """Get a hashable key that changes whenever the context content changes"""
+        buf_key = ()
+        if include_buffers:
+            buf_numbers = [buf.number for buf in self.get_active_buffers()]
+            buf_key = tuple(zip(buf_numbers, self.get_changedticks(buf_numbers), strict=True))
+        file_key = tuple((file_path, self._get_mtime(file_path)) for file_path in self.additional_files)
+        return buf_key, file_key
+
+    def get_changedticks(self, buf_numbers: List[int]) -> List[int]:
+        """Get the changedtick of each buffer in a single call"""
+        if not buf_numbers:
+            return []
+        return self.nvim.exec_lua(GET_CHANGEDTICKS_LUA, buf_numbers)
+
+    def get_buffer_sizes(self, buf_numbers: List[int]) -> List[int]:
+        """Get the size in bytes of each buffer in a single call"""
+        if not buf_numbers:
+            return []
+        return self.nvim.exec_lua(GET_BUFFER_SIZES_LUA, buf_numbers)
+
+    def _get_mtime(self, file_path: str) -> Optional[int]:
+        try:
+            return os.stat(file_path).st_mtime_ns
+        except OSError:
+            return None
+
     def clear_active_buffers(self):
         """Deactivate all buffers in context"""
         for ctx_buf in self.active_buffers.values():
             ctx_buf.is_active = False
+        self._changed()
 
     def toggle_buffer(self, buf_number: int):
         """Toggle buffer active state"""
         if buf_number in self.active_buffers:
             ctx_buf = self.active_buffers[buf_number]
             ctx_buf.is_active = not ctx_buf.is_active
+            self._changed()
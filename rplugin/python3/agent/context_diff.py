@@ -0,0 +1,54 @@
+import logging
+from typing import Dict, List, Tuple
+
+from pynvim.api import Buffer
+
+from .llm.constants import create_file_diff_prompt, create_file_prompt_from_lines
+
+DEFAULT_MAX_DIFF_RATIO = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class BufferDiffTracker:
+    """Tracks the buffer versions a conversation has already sent to the model.
+
+    Buffers are keyed by number and versioned by changedtick: an unchanged buffer is not sent
+    again, a changed one is sent as a unified diff against the version the model saw last.
+    """
+
+    def __init__(self, max_diff_ratio: float = DEFAULT_MAX_DIFF_RATIO):
+        self.max_diff_ratio = max_diff_ratio
+        self.seen: Dict[int, Tuple[str, int, List[str]]] = {}
+
+    def get_unseen(self, bufs: List[Buffer]) -> List[Buffer]:
+        """Get the buffers whose full content will be sent with the next user message"""
+        return [buf for buf in bufs if self.seen.get(buf.number, ("",))[0] != buf.name]
+
+    def build_context(self, bufs: List[Buffer], ticks: List[int]) -> str:
+        """Build the file contexts to attach to the next user message"""
+        contexts = []
+        for buf, tick in zip(bufs, ticks, strict=True):
+            seen = self.seen.get(buf.number)
+            if seen and seen[0] == buf.name and seen[1] == tick:
+                continue
+
+            lines = buf[:]
+            if seen and seen[0] == buf.name and seen[2] == lines:
+                self.seen[buf.number] = (buf.name, tick, lines)
+                continue
+
+            full_context = create_file_prompt_from_lines(buf.name, lines)
+            if seen and seen[0] == buf.name:
+                diff_context = create_file_diff_prompt(buf.name, seen[2], lines)
+                if len(diff_context) <= self.max_diff_ratio * len(full_context):
+                    contexts.append(diff_context)
+                else:
+                    logger.debug("Diff too large, resending full content of %s", buf.name)
+                    contexts.append(full_context)
+            else:
+                contexts.append(full_context)
+
+            self.seen[buf.number] = (buf.name, tick, lines)
+
+        return "".join(contexts)
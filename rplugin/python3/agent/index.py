@@ -0,0 +1,325 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import pynvim
+
+INDEX_FORMAT_VERSION = 3
+DEFAULT_TOKEN_BUDGET = 8000
+DEFAULT_MAX_FILE_BYTES = 512 * 1024
+# symbols defined in more files than this are too generic to point at a file
+MAX_FILES_PER_SYMBOL = 5
+MIN_SYMBOL_LENGTH = 3
+CHARS_PER_TOKEN = 4
+SAVE_DELAY_SECONDS = 30
+
+IGNORED_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    "node_modules",
+    ".venv",
+    "venv",
+    "__pycache__",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    ".tox",
+    "dist",
+    "build",
+    "target",
+    "vendor",
+}
+INDEXED_EXTENSIONS = {
+    ".py",
+    ".lua",
+    ".js",
+    ".jsx",
+    ".ts",
+    ".tsx",
+    ".go",
+    ".rs",
+    ".java",
+    ".kt",
+    ".c",
+    ".h",
+    ".cc",
+    ".cpp",
+    ".hpp",
+    ".cs",
+    ".rb",
+    ".php",
+    ".swift",
+    ".scala",
+    ".sh",
+}
+DEFINITION_PATTERNS = [
+    # def, class, fn, struct, ... followed by the name
+    re.compile(
+        r"^\s*(?:export\s+)?(?:default\s+)?(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:static\s+)?"
+        r"(?:def|class|function|fn|struct|enum|trait|interface|type|module|impl)\s+"
+        r"([A-Za-z_][A-Za-z0-9_]*)",
+        re.MULTILINE,
+    ),
+    # top-level constants and variables only, indented ones are locals
+    re.compile(
+        r"^(?:export\s+)?(?:pub(?:\([^)]*\))?\s+)?(?:const|let|var|static)\s+(?:mut\s+)?([A-Za-z_][A-Za-z0-9_]*)",
+        re.MULTILINE,
+    ),
+    # go functions and methods
+    re.compile(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_][A-Za-z0-9_]*)", re.MULTILINE),
+    # top-level lua module functions, M.name = function / function M.name
+    re.compile(r"^(?:local\s+)?function\s+[A-Za-z0-9_.:]*?([A-Za-z_][A-Za-z0-9_]*)\s*\(", re.MULTILINE),
+    re.compile(r"^(?:local\s+)?[A-Za-z0-9_.]*?([A-Za-z_][A-Za-z0-9_]*)\s*=\s*function\b", re.MULTILINE),
+]
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+logger = logging.getLogger(__name__)
+
+
+def extract_symbols(content: str) -> List[str]:
+    """Extract the names of the symbols defined in a source file"""
+    symbols = set()
+    for pattern in DEFINITION_PATTERNS:
+        for match in pattern.finditer(content):
+            symbol = match.group(1)
+            if len(symbol) >= MIN_SYMBOL_LENGTH:
+                symbols.add(symbol)
+    return sorted(symbols)
+
+
+class WorkspaceIndex:
+    """Symbol to file index of the workspace, used to pick context files for a message.
+
+    The index is built once in the background, reusing the persisted index for files whose
+    mtime and size did not change, and is then updated file by file on writes. Changes made
+    outside the editor are picked up by `refresh`, which re-checks the mtime and size of every
+    file. All indexing runs on a single worker thread.
+    """
+
+    def __init__(self, nvim: pynvim.Nvim):
+        self.nvim = nvim
+        config = self._get_index_config()
+        self.enabled = config.get("enabled", False)
+        self.mode = config.get("mode", "suggest")
+        self.token_budget = config.get("token_budget", DEFAULT_TOKEN_BUDGET)
+        self.max_file_bytes = config.get("max_file_bytes", DEFAULT_MAX_FILE_BYTES)
+        self.index_dir = self._get_index_dir(config.get("path"))
+        self.root = self.nvim.funcs.getcwd()
+        self.index_path = self._get_index_path(self.root)
+
+        # relative path -> (mtime_ns, size, symbols)
+        self.files: Dict[str, Tuple[int, int, List[str]]] = {}
+        self.symbols: Dict[str, Set[str]] = {}
+        self.ready = False
+        self._lock = threading.Lock()
+        self._dirty = False
+        # a build is queued and has not started walking yet, further refreshes are merged into it
+        self._build_pending = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-index")
+
+        if self.enabled:
+            self.rebuild()
+            atexit.register(self.save)
+
+    def _get_index_config(self) -> Dict:
+        agent_config = self.nvim.vars.get("agent_config", {})
+        return agent_config.get("index", {})
+
+    def _get_index_dir(self, path: Optional[str]) -> str:
+        return os.path.expanduser(path) if path else os.path.join(self.nvim.funcs.stdpath("cache"), "agent")
+
+    def _get_index_path(self, root: str) -> str:
+        root_hash = hashlib.sha1(root.encode()).hexdigest()[:16]
+        return os.path.join(self.index_dir, f"index_{root_hash}.json")
+
+    def build(self):
+        """Walk the workspace and (re)index every changed file"""
+        try:
+            with self._lock:
+                self._build_pending = False
+                persisted = dict(self.files) if self.ready else None
+            if persisted is None:
+                persisted = self._load()
+            files = {}
+            for rel_path, mtime, size in self._walk():
+                entry = persisted.get(rel_path)
+                if entry and entry[0] == mtime and entry[1] == size:
+                    files[rel_path] = entry
+                else:
+                    files[rel_path] = (mtime, size, self._read_symbols(rel_path))
+
+            symbols: Dict[str, Set[str]] = {}
+            for rel_path, (_, _, file_symbols) in files.items():
+                for symbol in file_symbols:
+                    symbols.setdefault(symbol, set()).add(rel_path)
+
+            with self._lock:
+                self.files = files
+                self.symbols = symbols
+                self.ready = True
+                # an unchanged workspace is not written again
+                self._dirty = self._dirty or files != persisted
+            self.save()
+            logger.debug("Indexed %d files with %d symbols", len(files), len(symbols))
+        except Exception as e:
+            logger.error(f"Workspace index build failed: {str(e)}")
+
+    def _walk(self):
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_DIRS and not entry.name.startswith("."):
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and os.path.splitext(entry.name)[1] in INDEXED_EXTENSIONS:
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_size <= self.max_file_bytes:
+                        yield os.path.relpath(entry.path, self.root), stat.st_mtime_ns, stat.st_size
+
+    def _read_symbols(self, rel_path: str) -> List[str]:
+        try:
+            with open(os.path.join(self.root, rel_path), "r", errors="ignore") as f:
+                return extract_symbols(f.read())
+        except OSError:
+            return []
+
+    def rebuild(self):
+        """Walk the workspace again in the background, unless a walk is already queued"""
+        with self._lock:
+            if self._build_pending:
+                return
+            self._build_pending = True
+        self._executor.submit(self.build)
+
+    def refresh(self):
+        """Re-index the files changed outside the editor, e.g. by a checkout, in the background"""
+        if self.enabled and self.ready:
+            self.rebuild()
+
+    def change_root(self, root: str):
+        """Switch to the index of another workspace after the working directory changed"""
+        if self.enabled and root != self.root:
+            self._executor.submit(self._change_root, root)
+
+    def _change_root(self, root: str):
+        self.save()
+        with self._lock:
+            self.root = root
+            self.index_path = self._get_index_path(root)
+            self.files = {}
+            self.symbols = {}
+            self.ready = False
+        self.build()
+
+    def update_file(self, file_path: str):
+        """Re-index a file after it was written, in the background"""
+        if self.enabled:
+            self._executor.submit(self._update_file, file_path)
+
+    def _update_file(self, file_path: str):
+        rel_path = os.path.relpath(file_path, self.root)
+        if rel_path.startswith("..") or os.path.splitext(rel_path)[1] not in INDEXED_EXTENSIONS:
+            return
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            stat = None
+
+        with self._lock:
+            old_entry = self.files.pop(rel_path, None)
+            if old_entry:
+                for symbol in old_entry[2]:
+                    defined_in = self.symbols.get(symbol)
+                    if defined_in:
+                        defined_in.discard(rel_path)
+                        if not defined_in:
+                            del self.symbols[symbol]
+
+        if stat and stat.st_size <= self.max_file_bytes:
+            file_symbols = self._read_symbols(rel_path)
+            with self._lock:
+                self.files[rel_path] = (stat.st_mtime_ns, stat.st_size, file_symbols)
+                for symbol in file_symbols:
+                    self.symbols.setdefault(symbol, set()).add(rel_path)
+
+        self._dirty = True
+        self._schedule_save()
+
+    def find_files(self, message: str, exclude: Set[str]) -> List[str]:
+        """Find the files defining identifiers mentioned in the message, within the token budget"""
+        if not self.ready:
+            return []
+
+        scores: Dict[str, float] = {}
+        with self._lock:
+            for identifier in set(IDENTIFIER_PATTERN.findall(message)):
+                defined_in = self.symbols.get(identifier)
+                if not defined_in or len(defined_in) > MAX_FILES_PER_SYMBOL:
+                    continue
+                # a symbol defined in a single file says more about it than a common one
+                for rel_path in defined_in:
+                    scores[rel_path] = scores.get(rel_path, 0) + 1 / len(defined_in)
+            sizes = {rel_path: self.files[rel_path][1] for rel_path in scores}
+
+        file_paths = []
+        budget = self.token_budget
+        for rel_path in sorted(scores, key=lambda p: (-scores[p], sizes[p])):
+            file_path = os.path.join(self.root, rel_path)
+            tokens = sizes[rel_path] // CHARS_PER_TOKEN
+            if file_path in exclude or tokens > budget:
+                continue
+            file_paths.append(file_path)
+            budget -= tokens
+        return file_paths
+
+    def estimate_tokens(self, file_path: str) -> int:
+        rel_path = os.path.relpath(file_path, self.root)
+        with self._lock:
+            entry = self.files.get(rel_path)
+        return entry[1] // CHARS_PER_TOKEN if entry else 0
+
+    def _load(self) -> Dict[str, Tuple[int, int, List[str]]]:
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_FORMAT_VERSION or data.get("root") != self.root:
+                return {}
+            return {rel_path: tuple(entry) for rel_path, entry in data["files"].items()}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _schedule_save(self):
+        if self._save_timer and self._save_timer.is_alive():
+            return
+        self._save_timer = threading.Timer(SAVE_DELAY_SECONDS, lambda: self._executor.submit(self.save))
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def save(self):
+        """Persist the index if it changed since it was last saved"""
+        if not self._dirty:
+            return
+        with self._lock:
+            data = {"version": INDEX_FORMAT_VERSION, "root": self.root, "files": dict(self.files)}
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.error(f"Failed to save workspace index: {str(e)}")
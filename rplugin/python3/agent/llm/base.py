@@ -1,14 +1,30 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Generator, List, Optional
 
+from .retry import StreamCancellation
+
 
 class LLMProvider(ABC):
     @abstractmethod
     def complete(self, messages: List[Dict], model: Optional[str] = None) -> str:
         pass
 
+    def _err_write(self, message: str):
+        """Report an error to the editor, safe to call from worker threads"""
+        self.nvim.async_call(self.nvim.err_write, message)
+
+    def warm_up(self):
+        """Open a connection to the API ahead of the first request, no-op by default"""
+        return
+
     @abstractmethod
     def complete_stream(
-        self, *, messages: List[Dict], model: Optional[str] = None, system_prompt: str = None
+        self,
+        *,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        system_prompt: str = None,
+        cancel: Optional[StreamCancellation] = None,
     ) -> Generator[str, None, None]:
+        """Stream the answer, a caller passing `cancel` owns the stream and reports its errors"""
         pass
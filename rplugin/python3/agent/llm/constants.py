@@ -1,3 +1,6 @@
+import difflib
+from typing import List
+
 CLAUDE_SONNET = "claude-3-5-sonnet-latest"
 BEDROCK_CLAUDE = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
 US_EAST_1 = "us-east-1"
@@ -13,6 +16,16 @@ FILE_CONTEXT_SYSTEM_PROMPT = """You have access to files from your environment,
 <context_files>
 {{FILES}}
 </context_files>"""
+BUFFER_DIFF_SYSTEM_PROMPT = """Files open in the editor are attached to the user messages.
+
+- The first time a file is attached it contains its full content
+- Later messages only contain a unified diff against the version you saw last
+- Apply the diffs to keep track of the current content of each file"""
+TURN_CONTEXT_PROMPT = """<context_files>
+{{FILES}}
+</context_files>
+
+{{MESSAGE}}"""
 
 FILE_CONTEXT_PROMPT = """
 ================================================
@@ -24,10 +37,36 @@ Active: {{ACTIVE}}
 
 """
 
+FILE_DIFF_CONTEXT_PROMPT = """
+================================================
+File: {{FILE}}
+Lines: {{LINES}}
+Diff: {{DIFF_LINES}} changed lines since the last message
+================================================
+{{DIFF}}
+
+"""
+
 
 def create_file_prompt_from_buf(buf):
-    content = "\n".join(buf[:]).strip()
-    return _create_file_context_prompt(buf.name, content, str(len(buf)), True)
+    return create_file_prompt_from_lines(buf.name, buf[:])
+
+
+def create_file_prompt_from_lines(file_path: str, lines: List[str]):
+    content = "\n".join(lines).strip()
+    return _create_file_context_prompt(file_path, content, str(len(lines)), True)
+
+
+def create_file_diff_prompt(file_path: str, old_lines: List[str], new_lines: List[str]):
+    diff = list(difflib.unified_diff(old_lines, new_lines, fromfile=file_path, tofile=file_path, lineterm=""))
+    changed_lines = sum(1 for line in diff[2:] if line[:1] in ("+", "-"))
+    return (
+        FILE_DIFF_CONTEXT_PROMPT.replace("{{FILE}}", file_path)
+        .replace("{{LINES}}", str(len(new_lines)))
+        .replace("{{DIFF_LINES}}", str(changed_lines))
+        .replace("{{DIFF}}", "\n".join(diff))
+        .lstrip()
+    )
 
 
 def create_file_prompt_from_file(file_path):
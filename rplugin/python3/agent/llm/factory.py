@@ -1,3 +1,4 @@
+import os
 from enum import Enum
 from typing import Callable, Dict, Optional, Union
 
@@ -6,21 +7,27 @@ import pynvim
 from .base import LLMProvider
 from .providers.anthropic import AnthropicProvider
 from .providers.bedrock import BedrockProvider
+from .providers.cassette import RECORD, REPLAY, CassetteProvider
+from .providers.hedged import DEFAULT_HEDGE_DEADLINE_MS, HedgedProvider, HedgeTarget
 
 
 class ModelProvider(Enum):
     ANTHROPIC = "anthropic"
     BEDROCK = "bedrock"
+    CASSETTE = "cassette"
 
 
 class LLMProviderFactory:
-    _providers: Dict[ModelProvider, Callable[[pynvim.Nvim], LLMProvider]] = {
-        ModelProvider.ANTHROPIC: lambda nvim: AnthropicProvider(nvim),
-        ModelProvider.BEDROCK: lambda nvim: BedrockProvider(nvim),
+    _providers: Dict[ModelProvider, Callable[..., LLMProvider]] = {
+        ModelProvider.ANTHROPIC: lambda nvim, **options: AnthropicProvider(nvim),
+        ModelProvider.BEDROCK: lambda nvim, **options: BedrockProvider(nvim, region=options.get("region")),
+        ModelProvider.CASSETTE: lambda nvim, **options: LLMProviderFactory.create_cassette(nvim),
     }
 
     @classmethod
-    def create(cls, nvim: pynvim.Nvim, model_provider: Optional[Union[str, ModelProvider]] = None) -> LLMProvider:
+    def create(
+        cls, nvim: pynvim.Nvim, model_provider: Optional[Union[str, ModelProvider]] = None, **options
+    ) -> LLMProvider:
         # model provider provided as input to function
         if isinstance(model_provider, str):
             model_provider = ModelProvider(model_provider)
@@ -29,6 +36,9 @@ class LLMProviderFactory:
             # model provider provided from config
             agent_config = nvim.vars.get("agent_config", {})
             if isinstance(agent_config, dict):
+                hedging = agent_config.get("hedging", {})
+                if hedging.get("enabled", False):
+                    return cls.create_hedged(nvim, hedging)
                 config_model_provider = agent_config.get("model_provider", "anthropic")
                 model_provider = ModelProvider(config_model_provider)
             else:
@@ -36,4 +46,44 @@ class LLMProviderFactory:
 
         provider_creator = cls._providers.get(model_provider)
 
-        return provider_creator(nvim)
+        return provider_creator(nvim, **options)
+
+    @classmethod
+    def create_cassette(cls, nvim: pynvim.Nvim) -> LLMProvider:
+        """Create a provider recording or replaying streams as set in the `cassette` config.
+
+        In record mode the streams of `cassette.provider` are recorded, replay needs no provider.
+        Cassettes are kept in `stdpath("cache")/agent/cassettes` unless `cassette.path` is set.
+        """
+        cassette = nvim.vars.get("agent_config", {}).get("cassette", {})
+        mode = cassette.get("mode", REPLAY)
+        provider = None
+        if mode == RECORD:
+            recorded_provider = ModelProvider(cassette.get("provider", ModelProvider.ANTHROPIC.value))
+            if recorded_provider == ModelProvider.CASSETTE:
+                raise ValueError("cassette.provider must be a real provider to record, not cassette")
+            provider = cls.create(nvim, recorded_provider)
+        path = cassette.get("path") or os.path.join(nvim.funcs.stdpath("cache"), "agent", "cassettes")
+        return CassetteProvider(
+            nvim,
+            provider,
+            path,
+            mode=mode,
+            speed=cassette.get("speed", 1.0),
+            strict=cassette.get("strict", False),
+        )
+
+    @classmethod
+    def create_hedged(cls, nvim: pynvim.Nvim, hedging: Dict) -> LLMProvider:
+        """Create a provider hedging across the providers listed in the `hedging` config.
+
+        Entries are either a provider name or a table with `provider` and optional `region` and `model`.
+        """
+        targets = []
+        for entry in hedging.get("providers", [ModelProvider.BEDROCK.value, ModelProvider.ANTHROPIC.value]):
+            if isinstance(entry, str):
+                entry = {"provider": entry}
+            name = ":".join(filter(None, [entry["provider"], entry.get("region")]))
+            provider = cls.create(nvim, entry["provider"], region=entry.get("region"))
+            targets.append(HedgeTarget(name, provider, entry.get("model")))
+        return HedgedProvider(nvim, targets, hedging.get("deadline_ms", DEFAULT_HEDGE_DEADLINE_MS))
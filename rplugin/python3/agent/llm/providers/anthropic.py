@@ -1,23 +1,60 @@
+import logging
 import os
-from typing import Dict, Generator, List, Optional
+from typing import Dict, Generator, Iterator, List, Optional
 
-from anthropic import Anthropic
+import httpx
+from anthropic import Anthropic, APIConnectionError, APIStatusError
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from ..base import LLMProvider
 from ..constants import BASE_SYSTEM_PROMPT, CLAUDE_SONNET, MAX_TOKENS, TEMPERATURE
+from ..retry import StreamCancellation, close_on_cancel, resumable_stream
+from ..transport import create_http_client, create_timeout, get_transport_config
+
+RETRYABLE_STREAM_ERROR_TYPES = {"overloaded_error", "api_error"}
+
+logger = logging.getLogger(__name__)
+
+
+def _is_retryable(error: Exception) -> bool:
+    # transport errors raised while reading the stream are not wrapped by the SDK
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, APIStatusError):
+        if error.status_code == 429 or error.status_code >= 500:
+            return True
+        # errors sent as stream events arrive with the 200 status of the stream itself
+        body = error.body if isinstance(error.body, dict) else {}
+        return body.get("error", {}).get("type") in RETRYABLE_STREAM_ERROR_TYPES
+    return False
 
 
 class AnthropicProvider(LLMProvider):
     def __init__(self, nvim):
         self.nvim = nvim
+        self.transport_config = get_transport_config(nvim)
+        self.http_client = create_http_client(self.transport_config)
         self.client = self._get_client()
 
     def _get_client(self):
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             self.nvim.err_write("Warning: Anthropic API key not configured\n")
-        return Anthropic(api_key=api_key)
+        # streams are retried by resumable_stream and completions by tenacity, not by the SDK on top
+        return Anthropic(
+            api_key=api_key,
+            http_client=self.http_client,
+            timeout=create_timeout(self.transport_config),
+            max_retries=0,
+        )
+
+    def warm_up(self):
+        # any response keeps the TCP+TLS connection in the pool for the first real request
+        try:
+            self.http_client.head(str(self.client.base_url))
+            logger.debug("Pre-connected to Anthropic API")
+        except Exception as e:
+            logger.debug("Anthropic pre-connect failed: %s", e)
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
     def complete(self, messages: List[Dict], model: Optional[str] = CLAUDE_SONNET) -> str:
@@ -34,29 +71,48 @@ class AnthropicProvider(LLMProvider):
             )
             return response.content[0].text
         except Exception as e:
-            self.nvim.err_write(f"Anthropic API error: {str(e)}\n")
+            self._err_write(f"Anthropic API error: {str(e)}\n")
             raise
 
     def complete_stream(
-        self, *, messages: List[Dict], model: Optional[str] = CLAUDE_SONNET, system_prompt: str = BASE_SYSTEM_PROMPT
+        self,
+        *,
+        messages: List[Dict],
+        model: Optional[str] = CLAUDE_SONNET,
+        system_prompt: str = BASE_SYSTEM_PROMPT,
+        cancel: Optional[StreamCancellation] = None,
     ) -> Generator[str, None, None]:
         if not self.client:
             raise ValueError("Anthropic client not configured")
 
         try:
-            response = self.client.messages.create(
-                system=system_prompt,
-                temperature=TEMPERATURE,
-                max_tokens=MAX_TOKENS,
-                model=model,
-                messages=messages,
-                stream=True,
+            yield from resumable_stream(
+                lambda request_messages: self._stream(request_messages, model, system_prompt, cancel),
+                messages,
+                _is_retryable,
+                self.transport_config["max_attempts"],
+                cancel,
             )
+        except Exception as e:
+            # a caller passing `cancel` reports the errors itself, e.g. only those of the winning attempt
+            if not cancel:
+                self._err_write(f"Anthropic streaming API error: {str(e)}\n")
+            raise
 
+    def _stream(
+        self, messages: List[Dict], model: str, system_prompt: str, cancel: Optional[StreamCancellation]
+    ) -> Iterator[str]:
+        response = self.client.messages.create(
+            system=system_prompt,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            model=model,
+            messages=messages,
+            stream=True,
+        )
+
+        # closes the connection when the stream is abandoned
+        with response, close_on_cancel(cancel, response.close):
             for chunk in response:
                 if chunk.type == "content_block_delta" and chunk.delta and chunk.delta.text:
                     yield chunk.delta.text
-
-        except Exception as e:
-            self.nvim.err_write(f"Anthropic streaming API error: {str(e)}\n")
-            raise
@@ -1,20 +1,62 @@
 import json
-from typing import Dict, Generator, List, Optional
+import logging
+from typing import Dict, Generator, Iterator, List, Optional
 
 import boto3
+import urllib3
+from botocore.awsrequest import AWSRequest
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from ..base import LLMProvider
 from ..constants import BASE_SYSTEM_PROMPT, BEDROCK_CLAUDE, MAX_TOKENS, TEMPERATURE, US_EAST_1
+from ..retry import StreamCancellation, close_on_cancel, resumable_stream
+from ..transport import create_botocore_config, get_transport_config
+
+# lower-cased, stream events use camelCase codes while API errors use PascalCase
+RETRYABLE_ERROR_CODES = {
+    "throttlingexception",
+    "serviceunavailableexception",
+    "internalserverexception",
+    "modelstreamerrorexception",
+    "modeltimeoutexception",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _is_retryable(error: Exception) -> bool:
+    # urllib3 errors raised while reading the event stream are not wrapped by botocore
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError, urllib3.exceptions.HTTPError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "").lower() in RETRYABLE_ERROR_CODES
+    return False
 
 
 class BedrockProvider(LLMProvider):
-    def __init__(self, nvim):
+    def __init__(self, nvim, region: Optional[str] = None):
         self.nvim = nvim
+        self.region = region or US_EAST_1
+        self.transport_config = get_transport_config(nvim)
         self.client = self._get_client()
 
     def _get_client(self):
-        return boto3.client(service_name="bedrock-runtime", region_name=US_EAST_1)
+        return boto3.client(
+            service_name="bedrock-runtime",
+            region_name=self.region,
+            config=create_botocore_config(self.transport_config),
+        )
+
+    def warm_up(self):
+        # send an unsigned HEAD through the client's own connection pool so the connection is reused
+        try:
+            request = AWSRequest(method="HEAD", url=self.client.meta.endpoint_url).prepare()
+            self.client._endpoint.http_session.send(request)
+            logger.debug("Pre-connected to Bedrock API")
+        except Exception as e:
+            logger.debug("Bedrock pre-connect failed: %s", e)
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
     def complete(self, messages: List[Dict], model: Optional[str] = BEDROCK_CLAUDE) -> str:
@@ -34,15 +76,37 @@ class BedrockProvider(LLMProvider):
             response_body = json.loads(response["body"].read())
             return response_body["content"][0]["text"]
         except Exception as e:
-            self.nvim.err_write(f"Bedrock API error: {str(e)}\n")
+            self._err_write(f"Bedrock API error: {str(e)}\n")
             raise
 
     def complete_stream(
-        self, *, messages: List[Dict], model: Optional[str] = BEDROCK_CLAUDE, system_prompt: str = BASE_SYSTEM_PROMPT
+        self,
+        *,
+        messages: List[Dict],
+        model: Optional[str] = BEDROCK_CLAUDE,
+        system_prompt: str = BASE_SYSTEM_PROMPT,
+        cancel: Optional[StreamCancellation] = None,
     ) -> Generator[str, None, None]:
         if not self.client:
             raise ValueError("Bedrock client not configured")
 
+        try:
+            yield from resumable_stream(
+                lambda request_messages: self._stream(request_messages, model, system_prompt, cancel),
+                messages,
+                _is_retryable,
+                self.transport_config["max_attempts"],
+                cancel,
+            )
+        except Exception as e:
+            # a caller passing `cancel` reports the errors itself, e.g. only those of the winning attempt
+            if not cancel:
+                self._err_write(f"Bedrock streaming API error: {str(e)}\n")
+            raise
+
+    def _stream(
+        self, messages: List[Dict], model: str, system_prompt: str, cancel: Optional[StreamCancellation]
+    ) -> Iterator[str]:
         request_body = {
             "anthropic_version": "bedrock-2023-05-31",
             "max_tokens": MAX_TOKENS,
@@ -51,14 +115,15 @@ class BedrockProvider(LLMProvider):
             "messages": messages,
         }
 
+        response = self.client.invoke_model_with_response_stream(modelId=model, body=json.dumps(request_body))
+        body = response.get("body")
         try:
-            response = self.client.invoke_model_with_response_stream(modelId=model, body=json.dumps(request_body))
-            for event in response.get("body"):
-                chunk = json.loads(event["chunk"]["bytes"])
-                if chunk["type"] == "content_block_delta":
-                    if chunk["delta"]["type"] == "text_delta":
-                        yield chunk["delta"]["text"]
-
-        except Exception as e:
-            self.nvim.err_write(f"Bedrock streaming API error: {str(e)}\n")
-            raise
+            with close_on_cancel(cancel, body.close):
+                for event in body:
+                    chunk = json.loads(event["chunk"]["bytes"])
+                    if chunk["type"] == "content_block_delta":
+                        if chunk["delta"]["type"] == "text_delta":
+                            yield chunk["delta"]["text"]
+        finally:
+            # closes the connection when the stream is abandoned
+            body.close()
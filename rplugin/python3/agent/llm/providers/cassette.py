@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Generator, List, Optional
+
+from ..base import LLMProvider
+from ..constants import BASE_SYSTEM_PROMPT
+from ..retry import StreamCancellation
+
+RECORD = "record"
+REPLAY = "replay"
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(messages: List[Dict], system_prompt: str, model: Optional[str]) -> str:
+    request = {"messages": messages, "system": system_prompt, "model": model}
+    return hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+class CassetteProvider(LLMProvider):
+    """Records provider streams to cassettes and replays them without network access.
+
+    A cassette holds the chunks of one streamed response with the delay before each chunk, keyed
+    by a hash of the request. Replay sleeps the recorded delays divided by `speed`, a speed of 0
+    replays instantly. Requests without a matching cassette replay the recorded cassettes in
+    turn, unless `strict` is set.
+    """
+
+    def __init__(
+        self,
+        nvim,
+        provider: Optional[LLMProvider],
+        path: str,
+        mode: str = REPLAY,
+        speed: float = 1.0,
+        strict: bool = False,
+    ):
+        self.nvim = nvim
+        self.provider = provider
+        self.path = os.path.expanduser(path)
+        self.mode = mode
+        self.speed = speed
+        self.strict = strict
+        self._next_fallback = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def warm_up(self):
+        if self.mode == RECORD:
+            self.provider.warm_up()
+
+    def complete(self, messages: List[Dict], model: Optional[str] = None) -> str:
+        return "".join(self.complete_stream(messages=messages, model=model))
+
+    def complete_stream(
+        self,
+        *,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        system_prompt: str = BASE_SYSTEM_PROMPT,
+        cancel: Optional[StreamCancellation] = None,
+    ) -> Generator[str, None, None]:
+        key = request_key(messages, system_prompt, model)
+        if self.mode == RECORD:
+            yield from self._record(key, messages, model, system_prompt, cancel)
+        else:
+            yield from self._replay(key, cancel)
+
+    def _record(
+        self,
+        key: str,
+        messages: List[Dict],
+        model: Optional[str],
+        system_prompt: str,
+        cancel: Optional[StreamCancellation],
+    ) -> Generator[str, None, None]:
+        kwargs = {"messages": messages, "system_prompt": system_prompt}
+        if cancel:
+            kwargs["cancel"] = cancel
+        if model:
+            kwargs["model"] = model
+
+        chunks = []
+        last = time.monotonic()
+        for text in self.provider.complete_stream(**kwargs):
+            now = time.monotonic()
+            chunks.append([round((now - last) * 1000), text])
+            last = now
+            yield text
+
+        # only complete responses are recorded
+        if cancel and cancel.is_set():
+            return
+        cassette = {"key": key, "recorded_at": datetime.now().isoformat(), "chunks": chunks}
+        with open(os.path.join(self.path, f"{key}.json"), "w") as f:
+            json.dump(cassette, f, separators=(",", ":"))
+        logger.debug("Recorded cassette %s with %d chunks", key, len(chunks))
+
+    def _replay(self, key: str, cancel: Optional[StreamCancellation]) -> Generator[str, None, None]:
+        cassette = self._load(key)
+        for delay_ms, text in cassette["chunks"]:
+            if self.speed > 0 and delay_ms > 0:
+                delay = delay_ms / 1000 / self.speed
+                if cancel:
+                    if cancel.wait(delay):
+                        return
+                else:
+                    time.sleep(delay)
+            if cancel and cancel.is_set():
+                return
+            yield text
+
+    def _load(self, key: str) -> Dict:
+        file_path = os.path.join(self.path, f"{key}.json")
+        if not os.path.exists(file_path):
+            if self.strict:
+                raise ValueError(f"No cassette recorded for request {key}")
+            file_path = self._get_fallback()
+        with open(file_path, "r") as f:
+            return json.load(f)
+
+    def _get_fallback(self) -> str:
+        file_names = sorted(name for name in os.listdir(self.path) if name.endswith(".json"))
+        if not file_names:
+            raise ValueError(f"No cassettes recorded in {self.path}")
+        with self._lock:
+            file_name = file_names[self._next_fallback % len(file_names)]
+            self._next_fallback += 1
+        return os.path.join(self.path, file_name)
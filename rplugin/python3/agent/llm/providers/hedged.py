@@ -0,0 +1,183 @@
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Generator, List, Optional
+
+from ..base import LLMProvider
+from ..constants import BASE_SYSTEM_PROMPT
+from ..retry import StreamCancellation
+
+DEFAULT_HEDGE_DEADLINE_MS = 2000
+LATENCY_SMOOTHING = 0.3
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeTarget:
+    def __init__(self, name: str, provider: LLMProvider, model: Optional[str] = None):
+        self.name = name
+        self.provider = provider
+        self.model = model
+
+
+class _StreamAttempt:
+    def __init__(self, target: HedgeTarget):
+        self.target = target
+        self.started_at = time.monotonic()
+        self.cancel = StreamCancellation()
+        self.failed = False
+
+
+class HedgedProvider(LLMProvider):
+    """Streams from the fastest of several providers.
+
+    The request goes to the provider with the lowest smoothed time to first token. If no token
+    arrived within the deadline, a backup request is started on the next provider. The first
+    attempt to produce output wins and the others are cancelled, closing their connections and
+    stopping their retries. Only errors of the winning attempt, or of all attempts, are reported.
+    Providers without latency stats yet are tried first, in configuration order. A failed attempt
+    counts as its elapsed time plus the deadline, so a provider that keeps failing drops behind
+    the healthy ones. An explicit `model` overrides the model of every target.
+    """
+
+    def __init__(self, nvim, targets: List[HedgeTarget], deadline_ms: int = DEFAULT_HEDGE_DEADLINE_MS):
+        self.nvim = nvim
+        self.targets = targets
+        self.deadline = deadline_ms / 1000
+        self.first_token_latency: Dict[str, float] = {}
+
+    def _ordered_targets(self) -> List[HedgeTarget]:
+        return sorted(self.targets, key=lambda target: self.first_token_latency.get(target.name, 0.0))
+
+    def _record_latency(self, name: str, latency: float):
+        previous = self.first_token_latency.get(name)
+        if previous is not None:
+            latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * previous
+        self.first_token_latency[name] = latency
+        logger.debug("Time to first token for %s: %.3fs", name, latency)
+
+    def _record_failure(self, name: str, elapsed: float):
+        self._record_latency(name, elapsed + self.deadline)
+
+    def warm_up(self):
+        for target in self.targets:
+            target.provider.warm_up()
+
+    def complete(self, messages: List[Dict], model: Optional[str] = None) -> str:
+        targets = self._ordered_targets()
+        for i, target in enumerate(targets):
+            target_model = model or target.model
+            started_at = time.monotonic()
+            try:
+                if target_model:
+                    return target.provider.complete(messages, model=target_model)
+                return target.provider.complete(messages)
+            except Exception:
+                self._record_failure(target.name, time.monotonic() - started_at)
+                if i == len(targets) - 1:
+                    raise
+                logger.debug("Falling back from %s to %s", target.name, targets[i + 1].name)
+
+    def complete_stream(
+        self,
+        *,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        system_prompt: str = BASE_SYSTEM_PROMPT,
+        cancel: Optional[StreamCancellation] = None,
+    ) -> Generator[str, None, None]:
+        try:
+            yield from self._hedged_stream(messages, model, system_prompt, cancel)
+        except Exception as e:
+            if not cancel:
+                self._err_write(f"Streaming API error: {str(e)}\n")
+            raise
+
+    def _hedged_stream(
+        self, messages: List[Dict], model: Optional[str], system_prompt: str, cancel: Optional[StreamCancellation]
+    ) -> Generator[str, None, None]:
+        targets = self._ordered_targets()
+        events = queue.Queue()
+        attempts: List[_StreamAttempt] = []
+        failed = 0
+        winner: Optional[_StreamAttempt] = None
+
+        def run(attempt: _StreamAttempt):
+            # the attempt owns its cancellation, so the provider leaves error reporting to the race
+            kwargs = {"messages": messages, "system_prompt": system_prompt, "cancel": attempt.cancel}
+            if model or attempt.target.model:
+                kwargs["model"] = model or attempt.target.model
+            stream = attempt.target.provider.complete_stream(**kwargs)
+            try:
+                for text in stream:
+                    if attempt.cancel.is_set():
+                        return
+                    events.put((attempt, "text", text))
+                events.put((attempt, "done", None))
+            except Exception as e:
+                events.put((attempt, "error", e))
+            finally:
+                stream.close()
+
+        def start_next():
+            attempt = _StreamAttempt(targets[len(attempts)])
+            attempts.append(attempt)
+            threading.Thread(target=run, args=(attempt,), daemon=True).start()
+            logger.debug("Started streaming attempt on %s", attempt.target.name)
+
+        def cancel_attempts():
+            for attempt in attempts:
+                attempt.cancel.cancel()
+
+        # cancelling the whole stream cancels every attempt
+        if cancel:
+            cancel.set_close(cancel_attempts)
+        try:
+            start_next()
+            while True:
+                timeout = None
+                if winner is None and len(attempts) < len(targets):
+                    timeout = max(0.0, attempts[-1].started_at + self.deadline - time.monotonic())
+
+                try:
+                    attempt, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    # deadline passed without a first token, hedge on the next provider
+                    start_next()
+                    continue
+
+                if winner is None:
+                    if kind == "error":
+                        attempt.failed = True
+                        failed += 1
+                        self._record_failure(attempt.target.name, time.monotonic() - attempt.started_at)
+                        if failed == len(targets):
+                            raise value
+                        if failed == len(attempts):
+                            start_next()
+                        continue
+
+                    winner = attempt
+                    now = time.monotonic()
+                    self._record_latency(attempt.target.name, now - attempt.started_at)
+                    for other in attempts:
+                        if other is winner:
+                            continue
+                        other.cancel.cancel()
+                        # an attempt started earlier is known to be at least this slow
+                        if not other.failed and other.started_at < winner.started_at:
+                            self._record_latency(other.target.name, now - other.started_at)
+
+                if attempt is not winner:
+                    continue
+                if kind == "text":
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    raise value
+        finally:
+            if cancel:
+                cancel.set_close(None)
+            cancel_attempts()
@@ -0,0 +1,122 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generator, Iterator, List, Optional
+
+DEFAULT_MAX_ATTEMPTS = 3
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class StreamCancellation:
+    """Cancels a stream from another thread.
+
+    Cancelling closes the response the stream is reading, so a stream still waiting for its
+    first token stops as well, and stops any retry of the stream.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._close: Optional[Callable[[], None]] = None
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep for `timeout` seconds, returning early with True when cancelled"""
+        return self._event.wait(timeout)
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            close, self._close = self._close, None
+        if close:
+            _close_quietly(close)
+
+    def set_close(self, close: Optional[Callable[[], None]]):
+        with self._lock:
+            if not self._event.is_set():
+                self._close = close
+                return
+        if close:
+            _close_quietly(close)
+
+
+def _close_quietly(close: Callable[[], None]):
+    try:
+        close()
+    except Exception as e:
+        logger.debug("Closing cancelled stream failed: %s", e)
+
+
+@contextmanager
+def close_on_cancel(cancel: Optional[StreamCancellation], close: Callable[[], None]):
+    """Close the open response when the stream is cancelled while it is read"""
+    if cancel is None:
+        yield
+        return
+    cancel.set_close(close)
+    try:
+        yield
+    finally:
+        cancel.set_close(None)
+
+
+def resumable_stream(
+    open_stream: Callable[[List[Dict]], Iterator[str]],
+    messages: List[Dict],
+    is_retryable: Callable[[Exception], bool],
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    cancel: Optional[StreamCancellation] = None,
+) -> Generator[str, None, None]:
+    """Stream a completion, resuming where it stopped after a retryable error.
+
+    The request is reissued with the output received so far as an assistant prefill, so the
+    model continues the answer instead of starting over. Text already yielded is never repeated.
+    A cancelled stream ends without error and is not retried.
+    """
+    output: List[str] = []
+    for attempt in range(1, max_attempts + 1):
+        if cancel and cancel.is_set():
+            return
+        request_messages = messages
+        # the API rejects a prefill ending in whitespace, whitespace already shown is skipped instead
+        pending_whitespace = ""
+        if output:
+            partial = "".join(output)
+            prefill = partial.rstrip()
+            pending_whitespace = partial[len(prefill) :]
+            if prefill:
+                request_messages = messages + [{"role": "assistant", "content": prefill}]
+
+        try:
+            for text in open_stream(request_messages):
+                if cancel and cancel.is_set():
+                    return
+                while pending_whitespace and text and text[0] == pending_whitespace[0]:
+                    text, pending_whitespace = text[1:], pending_whitespace[1:]
+                if not text:
+                    continue
+                pending_whitespace = ""
+                output.append(text)
+                yield text
+            return
+        except Exception as e:
+            # closing the response of a cancelled stream makes the read fail
+            if cancel and cancel.is_set():
+                logger.debug("Stream cancelled: %s", e)
+                return
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            delay = random.uniform(BACKOFF_MIN, min(BACKOFF_MAX, BACKOFF_MIN * 2**attempt))
+            logger.debug("Stream attempt %d failed (%s), resuming in %.1fs", attempt, e, delay)
+            if cancel:
+                if cancel.wait(delay):
+                    return
+            else:
+                time.sleep(delay)
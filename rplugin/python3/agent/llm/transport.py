@@ -0,0 +1,64 @@
+import importlib.util
+import logging
+from typing import Dict
+
+import httpx
+import pynvim
+from anthropic import DefaultHttpxClient
+from botocore.config import Config
+
+DEFAULT_TRANSPORT_CONFIG = {
+    "preconnect": False,
+    "max_connections": 10,
+    "max_keepalive_connections": 5,
+    "keepalive_expiry": 30.0,
+    "connect_timeout": 5.0,
+    "read_timeout": 600.0,
+    "http2": True,
+    "retry_mode": "adaptive",
+    # attempts of a streamed request, made by resumable_stream rather than the SDKs
+    "max_attempts": 3,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_transport_config(nvim: pynvim.Nvim) -> Dict:
+    """Get the `transport` table of `agent_config` merged over the defaults"""
+    agent_config = nvim.vars.get("agent_config", {})
+    return {**DEFAULT_TRANSPORT_CONFIG, **agent_config.get("transport", {})}
+
+
+def create_timeout(config: Dict) -> httpx.Timeout:
+    return httpx.Timeout(config["read_timeout"], connect=config["connect_timeout"])
+
+
+def create_http_client(config: Dict) -> httpx.Client:
+    """Create a pooled, keep-alive http client for the Anthropic API"""
+    http2 = config["http2"]
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.debug("h2 is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    return DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=config["max_connections"],
+            max_keepalive_connections=config["max_keepalive_connections"],
+            keepalive_expiry=config["keepalive_expiry"],
+        ),
+        timeout=create_timeout(config),
+        http2=http2,
+    )
+
+
+def create_botocore_config(config: Dict) -> Config:
+    """Create a pooled, keep-alive botocore config for the Bedrock API"""
+    # botocore does not retry itself, the retry mode only keeps its client-side rate limiting, so a
+    # throttled stream costs at most `max_attempts` requests
+    return Config(
+        max_pool_connections=config["max_connections"],
+        connect_timeout=config["connect_timeout"],
+        read_timeout=config["read_timeout"],
+        tcp_keepalive=True,
+        retries={"mode": config["retry_mode"], "total_max_attempts": 1},
+    )
@@ -27,9 +27,10 @@ class MCPClient:
 
         await self.session.initialize()
         logger.debug("Connected to MCP server")
-        logger.debug("session info")
-        session_info = await self.get_session_info()
-        logger.debug(session_info)
+        # fetching the session info costs three round trips, only do it when it gets logged
+        if logger.isEnabledFor(logging.DEBUG):
+            session_info = await self.get_session_info()
+            logger.debug("session info: %s", session_info)
 
         # List available tools
         # response = await self.session.list_tools()
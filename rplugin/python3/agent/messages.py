@@ -0,0 +1,111 @@
+import logging
+from typing import Callable, Dict, Iterator, List, Optional
+
+DEFAULT_MAX_MESSAGES = 100
+
+logger = logging.getLogger(__name__)
+
+
+class Message:
+    """A chat message whose content is kept as chunks and joined only when it is read.
+
+    Supports `msg["content"]` and `msg.get("context")` like the dicts it replaces. `tokens` caches
+    the token count of the message and is reset whenever the content grows.
+    """
+
+    __slots__ = ("role", "context", "tokens", "_chunks")
+
+    def __init__(self, role: str, content: str = "", context: Optional[str] = None):
+        self.role = role
+        self.context = context
+        self.tokens: Optional[int] = None
+        self._chunks = [content] if content else []
+
+    @property
+    def content(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def append(self, text: str):
+        self._chunks.append(text)
+        self.tokens = None
+
+    def __getitem__(self, key: str):
+        if key not in ("role", "content", "context"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, str]:
+        msg = {"role": self.role, "content": self.content}
+        if self.context:
+            msg["context"] = self.context
+        return msg
+
+    @classmethod
+    def from_dict(cls, msg: Dict[str, str]) -> "Message":
+        return cls(msg["role"], msg.get("content", ""), msg.get("context"))
+
+
+class MessageStore:
+    """Messages of the current conversation, keeping at most `max_messages` of them in memory.
+
+    Older messages are spilled once they are saved and reloaded from storage by `get_all` when the
+    full history is needed. A `max_messages` of 0 keeps every message in memory.
+    """
+
+    def __init__(self, reload: Callable[[], Optional[List[Dict]]], max_messages: int = DEFAULT_MAX_MESSAGES):
+        self._reload = reload
+        self.max_messages = max_messages
+        self.spilled = 0
+        self._messages: List[Message] = []
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def append(self, role: str, content: str = "", context: Optional[str] = None) -> Message:
+        msg = Message(role, content, context)
+        self._messages.append(msg)
+        return msg
+
+    def load(self, messages: List[Dict]):
+        """Replace the messages with the non-system ones of a stored conversation"""
+        self._messages = [Message.from_dict(msg) for msg in messages if msg["role"] != "system"]
+        self.spilled = 0
+
+    def clear(self):
+        self._messages = []
+        self.spilled = 0
+
+    def spill(self) -> List[Message]:
+        """Drop the oldest messages over the limit, they must already be saved"""
+        if not self.max_messages or len(self._messages) <= self.max_messages:
+            return []
+        count = len(self._messages) - self.max_messages
+        spilled = self._messages[:count]
+        del self._messages[:count]
+        self.spilled += count
+        logger.debug("Spilled %d messages, %d kept in memory", count, len(self._messages))
+        return spilled
+
+    def get_all(self) -> List[Message]:
+        """Get the full history, reloading the spilled messages from storage"""
+        if not self.spilled:
+            return list(self._messages)
+        stored = [msg for msg in self._reload() or [] if msg["role"] != "system"]
+        if len(stored) < self.spilled:
+            logger.warning("Only %d of %d spilled messages could be reloaded", len(stored), self.spilled)
+        return [Message.from_dict(msg) for msg in stored[: self.spilled]] + self._messages
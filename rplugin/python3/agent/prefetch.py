@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import pynvim
+
+from .context import AgentContext
+
+DEFAULT_DEBOUNCE_MS = 300
+
+logger = logging.getLogger(__name__)
+
+
+class ContextSnapshot:
+    def __init__(self, key: Hashable, blocks: List[str]):
+        self.key = key
+        self.blocks = blocks
+        self.prompt = "".join(blocks)
+
+
+class ContextPrefetcher:
+    """Keeps a ready-to-send system prompt up to date in the background.
+
+    The snapshot is keyed by the context state (active buffers with their changedtick and
+    additional files with their mtime), so it can be reused as long as nothing changed.
+    """
+
+    def __init__(
+        self,
+        nvim: pynvim.Nvim,
+        context: AgentContext,
+        build_blocks: Callable[[], List[str]],
+        include_buffers: bool = True,
+    ):
+        self.nvim = nvim
+        self.context = context
+        self._build_blocks = build_blocks
+        self.include_buffers = include_buffers
+        self.enabled, self.debounce_ms = self._get_prefetch_config()
+        self._snapshot: Optional[ContextSnapshot] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def _get_prefetch_config(self) -> Tuple[bool, int]:
+        agent_config = self.nvim.vars.get("agent_config", {})
+        prefetch = agent_config.get("context", {}).get("prefetch", {})
+        enabled = prefetch.get("enabled", True)
+        debounce_ms = prefetch.get("debounce_ms", DEFAULT_DEBOUNCE_MS)
+        return enabled, debounce_ms
+
+    def schedule(self, delay_ms: Optional[int] = None):
+        """Rebuild the snapshot once the context has been quiet for `delay_ms`."""
+        if not self.enabled:
+            return
+        delay_ms = self.debounce_ms if delay_ms is None else delay_ms
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay_ms / 1000, self.nvim.async_call, args=(self.refresh,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def refresh(self):
+        """Rebuild the snapshot if the context changed since it was built."""
+        try:
+            self._get_snapshot()
+        except Exception as e:
+            logger.error(f"Context prefetch failed: {str(e)}")
+
+    def get_prompt(self) -> str:
+        """Return the system prompt, reusing the prefetched snapshot if it is still current."""
+        if not self.enabled:
+            self._snapshot = ContextSnapshot(None, self._build_blocks())
+            return self._snapshot.prompt
+        return self._get_snapshot().prompt
+
+    def peek_snapshot(self) -> Optional[ContextSnapshot]:
+        """Get the last built snapshot without checking that it is current"""
+        return self._snapshot
+
+    def _get_snapshot(self) -> ContextSnapshot:
+        # the key is taken before building so a change made mid-build invalidates the snapshot
+        key = self.context.get_state_key(self.include_buffers)
+        snapshot = self._snapshot
+        if snapshot and snapshot.key == key:
+            return snapshot
+        snapshot = ContextSnapshot(key, self._build_blocks())
+        self._snapshot = snapshot
+        logger.debug("Rebuilt context snapshot")
+        return snapshot
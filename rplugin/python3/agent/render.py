@@ -0,0 +1,185 @@
+import re
+from typing import List, Tuple
+
+import pynvim
+from pynvim.api import Buffer, Window
+
+RENDER_MARKDOWN = "render_markdown"
+STREAMING = "streaming"
+NAMESPACE = "agent_markdown"
+HIGHLIGHT_LINKS = {
+    "AgentHeading": "Title",
+    "AgentCodeFence": "Comment",
+    "AgentCodeBlock": "CursorLine",
+    "AgentInlineCode": "String",
+    "AgentBold": "Bold",
+    "AgentQuote": "Comment",
+}
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+QUOTE_PATTERN = re.compile(r"^\s*>")
+INLINE_CODE_PATTERN = re.compile(r"`[^`]+`")
+BOLD_PATTERN = re.compile(r"\*\*[^*]+\*\*")
+
+WRITE_LINES_LUA = """
+local buf, win, start_line, lines = ...
+if not vim.api.nvim_buf_is_valid(buf) then
+  return
+end
+vim.bo[buf].modifiable = true
+vim.api.nvim_buf_set_lines(buf, start_line, -1, false, lines)
+vim.bo[buf].modifiable = false
+if win and vim.api.nvim_win_is_valid(win) then
+  vim.api.nvim_win_set_cursor(win, { vim.api.nvim_buf_line_count(buf), 0 })
+end
+"""
+SET_MARKS_LUA = """
+local buf, namespace, marks = ...
+if not vim.api.nvim_buf_is_valid(buf) then
+  return
+end
+local ns = vim.api.nvim_create_namespace(namespace)
+for _, mark in ipairs(marks) do
+  local line, start_col, end_col, group = unpack(mark)
+  if end_col < 0 then
+    vim.api.nvim_buf_set_extmark(buf, ns, line, 0, { line_hl_group = group })
+  else
+    vim.api.nvim_buf_set_extmark(buf, ns, line, start_col, { end_col = end_col, hl_group = group })
+  end
+end
+"""
+
+# (line, start byte, end byte or -1 for the whole line, highlight group)
+Mark = Tuple[int, int, int, str]
+
+
+def define_highlights(nvim: pynvim.Nvim):
+    for group, link in HIGHLIGHT_LINKS.items():
+        nvim.command(f"highlight default link {group} {link}")
+
+
+def set_marks(nvim: pynvim.Nvim, buf: Buffer, marks: List[Mark]):
+    if marks:
+        nvim.exec_lua(SET_MARKS_LUA, buf, NAMESPACE, marks)
+
+
+def clear_marks(nvim: pynvim.Nvim, buf: Buffer):
+    nvim.api.buf_clear_namespace(buf, nvim.api.create_namespace(NAMESPACE), 0, -1)
+
+
+def _byte_col(line: str, col: int) -> int:
+    return len(line[:col].encode())
+
+
+def _code_block_marks(lines: List[str], start: int, end: int) -> List[Mark]:
+    marks = []
+    for i in range(start, end):
+        group = "AgentCodeFence" if lines[i].lstrip().startswith("```") else "AgentCodeBlock"
+        marks.append((i, 0, -1, group))
+    return marks
+
+
+def _text_block_marks(lines: List[str], start: int, end: int) -> List[Mark]:
+    marks = []
+    for i in range(start, end):
+        line = lines[i]
+        if HEADING_PATTERN.match(line):
+            marks.append((i, 0, -1, "AgentHeading"))
+            continue
+        if QUOTE_PATTERN.match(line):
+            marks.append((i, 0, -1, "AgentQuote"))
+        for pattern, group in ((INLINE_CODE_PATTERN, "AgentInlineCode"), (BOLD_PATTERN, "AgentBold")):
+            for match in pattern.finditer(line):
+                marks.append((i, _byte_col(line, match.start()), _byte_col(line, match.end()), group))
+    return marks
+
+
+class MarkdownBlockScanner:
+    """Splits markdown lines into blocks and returns the highlights of each block once it is complete.
+
+    Lines are fed as they complete, a fenced code block ends at its closing fence and any other
+    block at the next blank line, heading or fence.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.block_start = 0
+        self.in_fence = False
+
+    def feed(self, lines: List[str], complete: int) -> List[Mark]:
+        """Scan `lines[:complete]`, lines before `complete` will not change anymore"""
+        marks = []
+        for i in range(self.scanned, complete):
+            line = lines[i]
+            is_fence = line.lstrip().startswith("```")
+            if self.in_fence:
+                if is_fence:
+                    marks += _code_block_marks(lines, self.block_start, i + 1)
+                    self.in_fence = False
+                    self.block_start = i + 1
+            elif is_fence:
+                marks += _text_block_marks(lines, self.block_start, i)
+                self.in_fence = True
+                self.block_start = i
+            elif not line.strip() or HEADING_PATTERN.match(line):
+                marks += _text_block_marks(lines, self.block_start, i + 1)
+                self.block_start = i + 1
+        self.scanned = max(self.scanned, complete)
+        return marks
+
+    def flush(self, lines: List[str]) -> List[Mark]:
+        """Finalize the open tail block at the end of the message"""
+        marks = self.feed(lines, len(lines))
+        if self.in_fence:
+            marks += _code_block_marks(lines, self.block_start, len(lines))
+        else:
+            marks += _text_block_marks(lines, self.block_start, len(lines))
+        self.block_start = len(lines)
+        self.in_fence = False
+        return marks
+
+
+def highlight_markdown(lines: List[str], offset: int = 0) -> List[Mark]:
+    """Highlights of complete markdown content starting at buffer line `offset`"""
+    return [(line + offset, start, end, group) for line, start, end, group in MarkdownBlockScanner().flush(lines)]
+
+
+class StreamingMarkdownRenderer:
+    """Writes a streamed message into the chat buffer, touching only its open tail.
+
+    Each chunk rewrites the last, still growing, line and appends the new ones. With `highlight`,
+    blocks are highlighted with extmarks once they are complete, the open tail block stays raw.
+    """
+
+    def __init__(self, nvim: pynvim.Nvim, buf: Buffer, win: Window, start_line: int, highlight: bool = True):
+        self.nvim = nvim
+        self.buf = buf
+        self.win = win
+        self.start_line = start_line
+        self.highlight = highlight
+        self.lines = [""]
+        self.scanner = MarkdownBlockScanner()
+
+    def append(self, text: str):
+        first_dirty = len(self.lines) - 1
+        parts = text.split("\n")
+        self.lines[-1] += parts[0]
+        self.lines.extend(parts[1:])
+
+        self._write(first_dirty, self.lines[first_dirty:])
+        # the last line may still be extended by the next chunk
+        self._set_marks(self.scanner.feed(self.lines, len(self.lines) - 1))
+
+    def finish(self):
+        self._set_marks(self.scanner.flush(self.lines))
+        # blank line closing the message, as in a full redraw
+        self._write(len(self.lines), [""])
+
+    def _write(self, line: int, lines: List[str]):
+        self.nvim.exec_lua(WRITE_LINES_LUA, self.buf, self.win, self.start_line + line, lines)
+
+    def _set_marks(self, marks: List[Mark]):
+        if not self.highlight:
+            return
+        offset = self.start_line
+        set_marks(self.nvim, self.buf, [(line + offset, start, end, group) for line, start, end, group in marks])
@@ -6,10 +6,28 @@ from typing import Dict, List, Optional
 import pynvim
 
 
+class _SavedConversation:
+    """Byte offsets of the messages written by the last save, so the next save can patch the file"""
+
+    def __init__(self, conversation_id: str, start: int, offsets: List[int], system_prompt: Optional[str]):
+        self.conversation_id = conversation_id
+        # index of the first message with a known offset, the last offset is the end of the list
+        self.start = start
+        self.offsets = offsets
+        self.system_prompt = system_prompt
+
+
 class ConversationStorage:
+    """Saves conversations as JSON files with one message per line.
+
+    The last saved conversation remembers where its messages start in the file, so saving it
+    again rewrites only the messages from a given index on and never reads the file back.
+    """
+
     def __init__(self, nvim: pynvim.Nvim):
         self.nvim = nvim
         self.storage_enabled, self.storage_path = self._get_storage_config()
+        self._saved: Optional[_SavedConversation] = None
         if self.storage_enabled:
             os.makedirs(self.storage_path, exist_ok=True)
 
@@ -20,28 +38,67 @@ class ConversationStorage:
         path = storage.get("path", None)
         return enabled, path
 
-    def save_conversation(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
-        """Save conversation to a JSON file."""
+    def _get_file_path(self, conversation_id: str) -> str:
+        return os.path.join(self.storage_path, f"conversation_{conversation_id}.json")
+
+    def save_conversation(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None,
+        start: int = 0,
+    ) -> None:
+        """Save the messages from index `start` on, keeping the ones before as they are in the file."""
         if not self.storage_enabled:
             return
-        file_path = os.path.join(
-            self.storage_path,
-            f"conversation_{
-                conversation_id}.json",
-        )
-        data = {"id": conversation_id, "timestamp": datetime.now().isoformat(), "messages": messages}
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=2)
+        file_path = self._get_file_path(conversation_id)
+        saved = self._saved if self._saved and self._saved.conversation_id == conversation_id else None
+        if system_prompt is None and saved:
+            system_prompt = saved.system_prompt
+
+        if start and saved and saved.start <= start < saved.start + len(saved.offsets):
+            offset = saved.offsets[start - saved.start]
+        else:
+            # offsets unknown, e.g. after the conversation was loaded, the file is rewritten once
+            stored = self._read(file_path) if start else {}
+            stored_messages = [msg for msg in stored.get("messages", []) if msg["role"] != "system"]
+            messages = stored_messages[:start] + messages
+            if system_prompt is None:
+                # files saved before the system prompt had its own key keep it as the first message
+                system_messages = [msg["content"] for msg in stored.get("messages", []) if msg["role"] == "system"]
+                system_prompt = stored.get("system", system_messages[0] if system_messages else None)
+            start = 0
+            offset = 0
+
+        offsets = []
+        with open(file_path, "r+b" if offset else "wb") as f:
+            if offset:
+                f.seek(offset)
+            else:
+                f.write(f'{{"id": {json.dumps(conversation_id)}, "messages": [\n'.encode())
+            for i, msg in enumerate(messages):
+                offsets.append(f.tell())
+                # the separator leads the line, so a message line never changes once written
+                separator = "," if start + i else ""
+                f.write(f"{separator}{json.dumps(msg)}\n".encode())
+            offsets.append(f.tell())
+            footer = {"system": system_prompt, "timestamp": datetime.now().isoformat()}
+            f.write(f"], {json.dumps(footer)[1:]}\n".encode())
+            f.truncate()
+        self._saved = _SavedConversation(conversation_id, start, offsets, system_prompt)
+
+    def _read(self, file_path: str) -> Dict:
+        try:
+            with open(file_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
 
     def load_conversation(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
         """Load conversation from JSON file."""
         if not self.storage_path:
             return None
-        file_path = os.path.join(
-            self.storage_path,
-            f"conversation_{
-                conversation_id}.json",
-        )
+        file_path = self._get_file_path(conversation_id)
         try:
             with open(file_path, "r") as f:
                 data = json.load(f)
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_CACHE_SIZE = 4096
+CHARS_PER_TOKEN = 4
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken, caching the count of each text by its hash.
+
+    Texts are counted as separate blocks (a message, a context file, a draft line), so only
+    blocks that changed since the last count are tokenized again. Until the encoding is loaded
+    in the background, counts are estimated from the text length.
+    """
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding = None
+        # bumped when the estimates are replaced by real counts, invalidating counts cached elsewhere
+        self.version = 0
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+        # loading may download the encoding on first use, keep it off the RPC thread
+        threading.Thread(target=self._load_encoding, daemon=True).start()
+
+    def _load_encoding(self):
+        try:
+            encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.error(f"Failed to load tiktoken encoding {self.encoding_name}: {str(e)}")
+            return
+        with self._lock:
+            self._encoding = encoding
+            # drop the estimates
+            self._cache.clear()
+            self.version += 1
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                return tokens
+            encoding = self._encoding
+
+        if encoding:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = len(text) // CHARS_PER_TOKEN + 1
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_blocks(self, blocks: Iterable[str]) -> int:
+        return sum(self.count(block) for block in blocks)
+
+
+def format_tokens(tokens: int) -> str:
+    if tokens >= 1000:
+        return f"{tokens / 1000:.1f}k"
+    return str(tokens)
@@ -1,35 +1,71 @@
+import atexit
 import logging
 import os
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
 
+DEFAULT_LOG_DIR = "~/nvim-plugins/logs"
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_LOG_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_LOG_BACKUP_COUNT = 3
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logger(config: Optional[Dict] = None):
+    """Log to a rotating file through a queue, so log calls never block on file I/O.
+
+    `config` is the `log` table of `agent_config`: level, path, max_bytes and backup_count.
+    """
+    global _listener
+    config = config or {}
 
-def setup_logger():
     # Create logs directory if it doesn't exist
-    log_dir = os.path.expanduser("~/nvim-plugins/logs")
+    log_dir = os.path.expanduser(config.get("path", DEFAULT_LOG_DIR))
     os.makedirs(log_dir, exist_ok=True)
 
     # Get the root logger
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(_get_level(config.get("level", DEFAULT_LOG_LEVEL)))
 
     # Clear any existing handlers to avoid duplicate logs
     if logger.hasHandlers():
         logger.handlers.clear()
+    if _listener:
+        _listener.stop()
 
-    # Create file handler
-    log_file = os.path.join(
-        log_dir,
-        f'nvim_plugin_{
-            datetime.now().strftime("%Y%m%d")}.log',
+    # Create rotating file handler, written to by the background listener only
+    log_file = os.path.join(log_dir, f"nvim_plugin_{datetime.now().strftime('%Y%m%d')}.log")
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=config.get("max_bytes", DEFAULT_LOG_MAX_BYTES),
+        backupCount=config.get("backup_count", DEFAULT_LOG_BACKUP_COUNT),
+        delay=True,
     )
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(logging.DEBUG)
 
     # Create formatter
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     file_handler.setFormatter(formatter)
 
-    # Add handler to logger
-    logger.addHandler(file_handler)
+    # Log calls only enqueue the record, the listener thread does the writing
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
 
     return logger
+
+
+def _get_level(level) -> int:
+    if isinstance(level, int):
+        return level
+    return logging.getLevelNamesMapping().get(str(level).upper(), logging.INFO)
+
+
+@atexit.register
+def _stop_listener():
+    # flush queued records before the host exits
+    if _listener:
+        _listener.stop()